@@ -7,10 +7,14 @@ import traceback	# Caller address
 import inspect		# To find correct number of fn arguments
 import numpy as np	# Stochastic random normal parameter adjustment
 import random		# Stochastic rule selection
+import math			# Truncate rule_select keys
+import os			# Remove merged cmds fragment files
+import multiprocessing	# Parallel plant generation in grow_plants()
+from L_NAP_CMDS import *	# Buffered cmds writer, CmdsWriter, and sinks
 
 class L_NAP:		# class name is the same as this import file name
 
-	def __init__(self, run_arg):
+	def __init__(self, run_arg, plantnr=None, seed=None):
 		#
 		# Set the L-system parameters dict p, either directly from run_arg,
 		# or Import from the given run_arg (+".py") and use locals() to: 
@@ -25,8 +29,13 @@ class L_NAP:		# class name is the same as this import file name
 		#   a change in self.p['stage'], for example, changes p['stage'] 
 		#	unless p is not presnet in run_arg, in which case we have 
 		#	only a local self.p .
+		# Given a plantnr, only that plant is grown, to its own cmds file,
+		# as in a run with 'plant_seed' or 'workers' with the same seed,
+		# the given seed, or else p['seed'].
 		# 
 		self.p_routines = {}	#dict of_p routines as {'name':address,}
+		self.rule_table = {}	#dict of main_rule fn: its _p routine
+		self.caller = None		#main_rule fn currently being performed
 		self.run_arg = "LN"
 		self.dir = dir(L_NAP)
 				
@@ -74,10 +83,27 @@ class L_NAP:		# class name is the same as this import file name
 			name = self.run_arg[0:-2]
 		else:
 			name = self.run_arg
+		run_name = name
+		if plantnr is not None:
+			name = f"{name}_{plantnr:04}"
+		self.name = name
 		self.cmds_filename = f"{name}.cmds"	
-		self.cmds_file = open(self.cmds_filename,"w")
+		#
+		# The cmds_file is a CmdsWriter, buffering the cmds of each plant
+		# until its finish, to a 'cmds_sink' of "file", "gzip", "memory" 
+		# or "null". In 'production' mode the comment lines are not written.
+		# With 'cmdb' the structured cmds are written to a binary .cmdb file.
+		#
+		sink = self.p['cmds_sink'] if 'cmds_sink' in self.p else "file"
+		production = self.p['production'] if 'production' in self.p else False
+		sink, self.cmds_filename = open_sink(self.cmds_filename, sink)
+		index = f"{self.cmds_filename}.idx" if self.cmds_filename else None
+		self.cmds_file = CmdsWriter(sink, comments=not production, 
+									index_filename=index)
 		# Allow application to write to cmds_file
 		self.p['cmds_file'] = self.cmds_file
+		cmdb = self.p['cmdb'] if 'cmdb' in self.p else False
+		self.cmdb_file = CmdbWriter(f"{name}.cmdb") if cmdb else None
 		
 		# List buffers for computed rules, results
 		self.rules = []
@@ -86,8 +112,69 @@ class L_NAP:		# class name is the same as this import file name
 		
 		# Either repeat all rendoms in run or start randomly
 		# and save Random obect as p['Random']
+		if seed is not None:
+			self.p['seed'] = seed
 		self.seed = self.p["seed"] if 'seed' in self.p else None
 		self.p['Random'] = np.random.RandomState(self.seed) 
+		# and a Random object for stochastic rule selection as p['Select']
+		self.p['Select'] = random.Random(self.seed)
+		#
+		# With 'plant_seed' (or parallel 'workers') each plant is seeded 
+		# from (seed, PlantNr) instead, so its cmds do not depend on any
+		# previous plants. A random run then draws a single base seed.
+		#
+		self.plant_seed = self.p['plant_seed'] if 'plant_seed' in self.p \
+							else 'workers' in self.p
+		if plantnr is not None:
+			# A single plant is only the same plant as in its run when 
+			# that run was plant seeded, and from the same base seed, as
+			# recorded in the index file of the run, if present
+			recorded = None
+			for index in (f"{run_name}.cmds.idx", f"{run_name}.cmds.gz.idx"):
+				if os.path.exists(index):
+					recorded = index_seed(index)
+					if recorded is None:
+						raise ValueError(f"Plant {plantnr} cannot be regrown, "
+							f"as {index} is of a run without 'plant_seed'")
+					break
+			if recorded is None and not self.plant_seed:
+				raise ValueError(f"Plant {plantnr} can only be regrown from "
+					"a run with 'plant_seed' or 'workers'")
+			if self.seed is None:
+				self.seed = recorded
+			elif recorded is not None and self.seed != recorded:
+				raise ValueError(f"Plant {plantnr} is of the run of seed "
+					f"{recorded}, not {self.seed}")
+			if self.seed is None:
+				raise ValueError(f"Plant {plantnr} can only be regrown with "
+					"the seed of its run, as in its '# plant_seed:' header")
+			if not 1 <= plantnr <= self.p['Plants']:
+				raise ValueError(f"Plant {plantnr} is not one of the "
+					f"{self.p['Plants']} Plants of the run")
+			self.plant_seed = True
+			self.p['workers'] = 1
+			self.goto_plant(plantnr)
+		if self.plant_seed:
+			if self.seed is None:
+				self.seed = int(np.random.SeedSequence().generate_state(1)[0])
+				print(f"Base seed: {self.seed}")
+			# Recorded, so that any plant of the run can be regrown
+			self.p['seed'] = self.seed
+			self.cmds_file.header(self.seed)
+		self.fragment = False	# True when writing a cmds fragment file
+		
+		# The (opcode, args) cmds of the current plant, captured for 
+		# iter_plants() and cmdb_file, and the object names indexed by 
+		# draw_obj args[0]
+		self.capture = self.cmdb_file is not None
+		self.plant_cmds = None
+		self.objects = []
+		
+		# Rule classification caches, so that each rule fn is classified
+		# once per run, with hit/miss counters to check on them.
+		self.rule_cache_hits = 0
+		self.rule_cache_misses = 0
+		self.clear_rule_cache()
 			
 	#
 	# Definition of a Production rule, (a main-rule) and a definition of
@@ -98,26 +185,32 @@ class L_NAP:		# class name is the same as this import file name
 	#	
 	def __call__(self, *rules):
 		#
-		# Get the name of the caller, such as "Axiom", using traceback,
-		# and hence the _p function, such as "Axiom_p",
-		# and call that _p fuction to get p as a dictionary of key:value 
-		# pairs, which are to be applied to all produced *rules defined 
-		# in this current Rule.
-		# The actual call args have been stored by the caller ,,,
+		# Get the _p function of the main_rule now being performed by
+		# call_rule(), such as "Axiom_p" of Axiom, from rule_table, where
+		# it was bound once, and call that _p function to get p as a 
+		# dictionary of key:value pairs, which are to be applied to all 
+		# produced *rules defined in this current Rule.
+		# Only a rule fn called directly, by the application, falls 
+		# back to finding its name, such as "Axiom", from the traceback.
 		#
 		p = None	# No dictionary
-		stack_trace = traceback.extract_stack(limit=5)
-		caller_detail = f'{stack_trace[-2]}'
-		caller = caller_detail.split()[-1]
-		l = len(caller)
-		if l > 1:
-			caller = caller[0:l-1]
-			name = caller + '_p'		# a name such as: "Axiom_p"
-			fn = self.p_routines[name] if name in self.p_routines else None
+		if self.caller in self.rule_table:
+			fn = self.rule_table[self.caller]
 			if fn:
-				p = fn()	# We are in Rule, and we want to know the
-							# calling main_rule, such as Axiom to get
-							# its parameter dict into p.
+				p = fn()
+		else:
+			stack_trace = traceback.extract_stack(limit=5)
+			caller_detail = f'{stack_trace[-2]}'
+			caller = caller_detail.split()[-1]
+			l = len(caller)
+			if l > 1:
+				caller = caller[0:l-1]
+				name = caller + '_p'	# a name such as: "Axiom_p"
+				fn = self.p_routines[name] if name in self.p_routines else None
+				if fn:
+					p = fn()	# We are in Rule, and we want to know the
+								# calling main_rule, such as Axiom to get
+								# its parameter dict into p.
 			#				
 			# Note: in command() the call_args of each main_rule are 
 			# stored into self.p, which is same address
@@ -133,6 +226,35 @@ class L_NAP:		# class name is the same as this import file name
 
 		return None # To avoid return stmt in every L_NAP Rule def
 					# self.perform() picks up self.result list instead.	
+	#
+	# Bind a main_rule fn, such as Axiom, once to its _p function, such as
+	# Axiom_p, in the rule dispatch table. Use as a decorator on each 
+	# rule definition of the application, as in L_NAPA.py:
+	#
+	#	@L_NAPA.rule
+	#	def Axiom():	L_NAPA(Stalk, GrainSpace)
+	#
+	# Rules not so bound are bound on their first call by call_rule().
+	#
+	def rule(self, fn):
+		name = fn.__name__ + '_p'
+		self.rule_table[fn] = self.p_routines[name] \
+				if name in self.p_routines else None
+		return fn
+	#
+	# Call the given main_rule fn with its call_args, noting it as the
+	# current caller, so that __call__ finds its _p function in rule_table.
+	# (A main_rule only returns after its nested __call__ is complete.)
+	#
+	def call_rule(self, fn, *call_args):
+		if fn not in self.rule_table:
+			self.rule(fn)
+		caller = self.caller
+		self.caller = fn
+		try:
+			return fn(*call_args)
+		finally:
+			self.caller = caller
 		
 	def translate_string_to_result(self, p, rule):
 		for ch in rule:
@@ -163,14 +285,32 @@ class L_NAP:		# class name is the same as this import file name
 			rul = rule
 			args = None
 		
-		routine_name = self.rule_name(rul)
-		if hasattr(L_NAP, routine_name): 
-			rul = eval("self."+routine_name)
-			return (rul, True)	#No args on Draw, etc
+		if rul in self.terminal_cache:
+			self.rule_cache_hits += 1
+			terminal = self.terminal_cache[rul]
+		else:
+			self.rule_cache_misses += 1
+			terminal = None
+			routine_name = self.rule_name(rul)
+			if hasattr(L_NAP, routine_name): 
+				terminal = eval("self."+routine_name)
+			self.terminal_cache[rul] = terminal
+			
+		if terminal:
+			return (terminal, True)	#No args on Draw, etc
 		else:
 			return (rule, False)
 			
 	def is_main_rule(self, rule):
+		if rule in self.main_rule_cache:
+			self.rule_cache_hits += 1
+			return self.main_rule_cache[rule]
+		self.rule_cache_misses += 1
+		is_main = self.find_main_rule(rule)
+		self.main_rule_cache[rule] = is_main
+		return is_main
+		
+	def find_main_rule(self, rule):
 		if len(self.p_routines) > 0:
 			rule_name_p = self.rule_name(rule) + "_p"
 			for routine in self.p_routines:
@@ -190,6 +330,21 @@ class L_NAP:		# class name is the same as this import file name
 				return False
 			return False
 		
+	#
+	# Clear the rule classification caches, when p_routines has changed,
+	# and rebind the main_rules of the rule dispatch table.
+	#
+	def clear_rule_cache(self):
+		self.terminal_cache = {}	#dict of rule fn: L_NAP method or None
+		self.main_rule_cache = {}	#dict of rule fn: True if main_rule
+		self.rule_cache_routines = self.p_routines.copy()
+		for fn in list(self.rule_table):
+			self.rule(fn)
+			
+	def check_rule_cache(self):
+		if self.p_routines != self.rule_cache_routines:
+			self.clear_rule_cache()
+		
 	def type_of_rule(self, rule):
 		#
 		# Determine the type of rule, and return:
@@ -355,11 +510,18 @@ class L_NAP:		# class name is the same as this import file name
 			# A final draw command is a string
 			if isinstance(rewrite, str):
 				self.cmds_file.write(rewrite + "\n")
+				if self.plant_cmds is not None and isinstance(rewrite, Cmd):
+					self.plant_cmds.extend(rewrite.ops)
 			#
 			# Otherwise it may be a tuple, a fn rule yet to be rewritten
 			# which if its arg is a dict is recreated that  float 
 			# values have only 4 digits.  
 			#		
+			# Comment lines are not required in production mode
+			elif not self.cmds_file.comments:
+				if isinstance(rewrite, list):
+					for rew in rewrite:
+						self.cmds_log(rew)
 			elif isinstance(rewrite, tuple):
 				fn = rewrite[0]
 				if isinstance(fn, types.FunctionType):
@@ -451,10 +613,11 @@ class L_NAP:		# class name is the same as this import file name
 				
 	# Calculate the next derivation stage
 	def next_stage(self, axiom):
+		self.check_rule_cache()
 		if self.p['stage'] == 0:
 
 			# Get initial plant rules, by calling given local axiom fn
-			axiom()
+			self.call_rule(axiom)
 
 			self.rules = self.result.copy()
 			self.result = []	
@@ -481,6 +644,9 @@ class L_NAP:		# class name is the same as this import file name
 			self.result = []
 			
 			self.cmds_file.write(f"\tfinish({self.p['PlantNr']})\n")
+			self.cmds_file.flush(self.p['PlantNr'])	# One write of plant cmds
+			if self.cmdb_file:
+				self.cmdb_file.write_plant(self.p['PlantNr'], self.plant_cmds)
 			
 			return False
 			
@@ -515,6 +681,9 @@ class L_NAP:		# class name is the same as this import file name
 
 		# Next plant
 		self.p['PlantNr'] += 1
+		if self.plant_seed:
+			self.seed_plant(self.p['PlantNr'])
+		self.plant_cmds = [] if self.capture else None
 
 #
 #  'deltas': (('Grain_count', 50, 70, 90, 110), ('7',   30,  40,  50,  60), 
@@ -544,12 +713,13 @@ class L_NAP:		# class name is the same as this import file name
 			f"\tplantnr({self.p['PlantNr']})	# Start\n")
 		
 		# Log the variable parameters for this plant	
-		for m, delta in enumerate(self.p['deltas']):
-			key = delta[0]
-			value = self.p[key]
-			self.cmds_file.write(
-			f"\n# Plant: {plantnr}: has parameter {key}: {value}")
-		self.cmds_file.write("\n")
+		if self.cmds_file.comments:
+			for m, delta in enumerate(self.p['deltas']):
+				key = delta[0]
+				value = self.p[key]
+				self.cmds_file.write(
+				f"\n# Plant: {plantnr}: has parameter {key}: {value}")
+			self.cmds_file.write("\n")
 
 		# Reset to stage 0 for next plant
 		self.p['stage'] = 0
@@ -559,6 +729,126 @@ class L_NAP:		# class name is the same as this import file name
 		return True
 				
 	#
+	# Seed both p['Random'] and p['Select'] for the given plantnr, from
+	# the base seed, independently of all other plants.
+	#
+	def seed_plant(self, plantnr):
+		seed = np.random.SeedSequence([self.seed, plantnr]).generate_state(1)[0]
+		self.p['Random'].seed(seed)
+		self.p['Select'].seed(int(seed))
+	#
+	# Go straight to the given plantnr, so that the next plants grown are
+	# plantnr onwards, for the given number of plants. With plant_seed 
+	# each plant is the same as in a run of all plants.
+	#
+	def goto_plant(self, plantnr, plants=1):
+		self.p['PlantNr'] = plantnr - 1
+		self.p['Plants'] = plants
+	#
+	# Grow all p['Plants'] plants serially from the given axiom, as a 
+	# generator of (PlantNr, cmds) per plant, where cmds is the list of 
+	# (opcode, args) of the plant, for opcodes in L_NAP_CMDS OPS, such as
+	# (OPCODE['draw'], (length, width)). The cmds file is still written, 
+	# unless p['cmds_sink'] is "null".
+	#
+	def iter_plants(self, axiom):
+		self.capture = True
+		while self.next_plant():
+			while self.next_stage(axiom):
+				self.grow()
+			yield (self.p['PlantNr'], self.plant_cmds)
+		self.capture = self.cmdb_file is not None
+		self.plant_cmds = None
+	#
+	# Grow all p['Plants'] plants from the given axiom, either serially, 
+	# or with p['workers'] > 1 in parallel by forked worker processes, 
+	# each growing a contiguous shard of plants to cmds fragment files.
+	# The fragments are merged in PlantNr order into the cmds (and cmdb) 
+	# file, and since each plant is seeded from (seed, PlantNr), the cmds
+	# file is identical for any number of workers.
+	#
+	def grow_plants(self, axiom):
+		workers = self.p['workers'] if 'workers' in self.p else 1
+		if workers <= 1:
+			while self.next_plant():
+				while self.next_stage(axiom):
+					self.grow()
+			return
+			
+		# Contiguous shards of plants, several per worker to balance load
+		first = self.p['PlantNr'] + 1
+		plants = self.p['Plants']
+		nshards = min(plants, 4*workers)
+		shards = []
+		for k in range(nshards):
+			start = first + plants*k//nshards
+			end = first + plants*(k+1)//nshards
+			shards.append((start, end-start, f"{self.name}.{k:04}"))
+			
+		# Workers inherit this object and axiom by fork, and must not
+		# inherit any buffered cmds
+		self.cmds_file.flush()
+		self.cmds_file.sink.flush()
+		if self.cmdb_file:
+			self.cmdb_file.file.flush()
+		shared['L_NAP'] = self
+		shared['axiom'] = axiom
+		with multiprocessing.get_context("fork").Pool(workers) as pool:
+			fragments = pool.map(grow_shard, shards)
+			
+		for fragment, hits, misses in fragments:
+			self.rule_cache_hits += hits
+			self.rule_cache_misses += misses
+			self.cmds_file.append_file(fragment + ".cmds")
+			if self.cmdb_file:
+				self.merge_cmdb(fragment + ".cmdb")
+			
+		self.p['PlantNr'] = first + plants - 1
+		self.p['Plants'] = 0
+		self.next_plant()	# Close files
+	#
+	# In a worker process, grow count plants from plantnr first, to the 
+	# cmds fragment file filename.cmds (and filename.cmdb), and return
+	# filename, with the rule cache hits and misses of these plants.
+	# The cmds and cmdb files inherited from the parent by fork are kept
+	# open in shared['inherited'] until the worker exits, as closing them,
+	# such as on their garbage collection, would write to the parent's 
+	# files, such as a gzip trailer.
+	#
+	def grow_fragment(self, axiom, first, count, filename):
+		if not self.fragment:
+			shared['inherited'] = (self.cmds_file, self.cmdb_file)
+		hits, misses = self.rule_cache_hits, self.rule_cache_misses
+		self.cmds_file = CmdsWriter(open(filename + ".cmds", "w"), 
+									comments=self.cmds_file.comments,
+									index_filename=filename + ".cmds.idx")
+		self.p['cmds_file'] = self.cmds_file
+		if self.cmdb_file:
+			self.cmdb_file = CmdbWriter(filename + ".cmdb")
+		self.fragment = True
+		self.goto_plant(first, count)
+		while self.next_plant():
+			while self.next_stage(axiom):
+				self.grow()
+		return filename, self.rule_cache_hits - hits, \
+				self.rule_cache_misses - misses
+	#
+	# Append the plants of a cmdb fragment file to cmdb_file, with its
+	# draw_obj object indexes renumbered to self.objects, and remove it.
+	#
+	def merge_cmdb(self, filename):
+		reader = CmdbReader(filename)
+		renumber = np.array([self.object_index(name) 
+							for name in reader.objects] + [0], dtype=np.float32)
+		for plantnr, records in reader:
+			records = np.array(records)
+			objs = records['op'] == OPCODE['draw_obj']
+			records['args'][objs, 0] = \
+				renumber[records['args'][objs, 0].astype(int)]
+			self.cmdb_file.write_records(plantnr, records)
+		reader.close()
+		os.remove(filename)
+	#
 	# Return the printable rule_name
 	#
 	def rule_name(self, rule):
@@ -624,7 +914,7 @@ class L_NAP:		# class name is the same as this import file name
 			key = main_rule_name + '_args'
 			self.p[key] = call_args
 
-			cmd = rule[0](*call_args)
+			cmd = self.call_rule(main_rule, *call_args)
 		
 		# Draw, etc terminal rule as:    (rul, (p,index))
 		elif lrule == 2:
@@ -651,7 +941,7 @@ class L_NAP:		# class name is the same as this import file name
 						break	
 		# Probability expression, which is float
 		elif isinstance(keys[0], (float, int)):	
-			rand0to1 = random.random()
+			rand0to1 = self.p['Select'].random()
 			
 			# define that No rule applied and no previous fractional value
 			fracts = 0.
@@ -669,8 +959,11 @@ class L_NAP:		# class name is the same as this import file name
 		
 	def close_files(self):
 		#-self.rules_file.close()
-		self.cmds_file.write("\n")
+		if not self.fragment:
+			self.cmds_file.write("\n")
 		self.cmds_file.close()
+		if self.cmdb_file:
+			self.cmdb_file.close(self.objects)
 #-----------------------------------------------------------------------	
 # Pre-defined L_NAP rules
 #
@@ -699,24 +992,28 @@ class L_NAP:		# class name is the same as this import file name
 		output to cmds file.
 		""" 
 		cmd = ''
+		ops = []
 		rule = p['rule'] if 'rule' in p else ''			
 		if 'curve' in p:
 			for pitch, turn, length, width in p['curve']:
 				if pitch != 0:
 					arg = f'pitch_up(angle={pitch:0.4f})'
 					cmd += f"\n\t{arg:<54}#'.' : {rule} Pitch"
+					ops.append(self.op('pitch_up', pitch))
 					
 				if turn != 0:
 					arg = f'turn_left(angle={turn:0.4f})'
 					cmd += f"\n\t{arg:<54}#'.' : {rule} Turn"
+					ops.append(self.op('turn_left', turn))
 
 				if length > 0 and width > 0:
 					arg = f'draw(length={length:0.4f}, width={width:0.4f})'
 					cmd += f"\n\t{arg:<54}#'F' : {rule} Draw"
+					ops.append(self.op('draw', length, width))
 					
 		#if len(cmd) <= 0 ?? invalid syntex??
 		#	cmd = None
-		return cmd
+		return Cmd(cmd, ops)
 			
 	def Draw(self, p):	
 		"""
@@ -727,7 +1024,8 @@ class L_NAP:		# class name is the same as this import file name
 		if length > 0 and width > 0:
 			rule = p['rule'] if 'rule' in p else ''			
 			arg = f'draw(length={length:0.4f}, width={width:0.4f})'
-			cmd = f"\t{arg:<54}#'F' : {rule} Draw"
+			cmd = Cmd(f"\t{arg:<54}#'F' : {rule} Draw",
+					[self.op('draw', length, width)])
 		return cmd
 
 	def Internode(self, p):	
@@ -742,7 +1040,8 @@ class L_NAP:		# class name is the same as this import file name
 		if length > 0:			
 			rule = p['rule'] if 'rule' in p else ''	
 			arg = f'move(length={length:0.4f})'
-			cmd = f"\t{arg:<54}#'f' : {rule} Move"
+			cmd = Cmd(f"\t{arg:<54}#'f' : {rule} Move",
+					[self.op('move', length)])
 		return cmd
 	def f(self, p):
 		return self.Move(p)
@@ -753,10 +1052,12 @@ class L_NAP:		# class name is the same as this import file name
 			rule = p['rule'] if 'rule' in p else ''	
 			if pitch < 0:
 				arg = f'pitch_down(angle={-pitch:0.4f})'
-				cmd=f"\t{arg:<54}#'^' : {rule} Pitch"
+				cmd=Cmd(f"\t{arg:<54}#'^' : {rule} Pitch",
+						[self.op('pitch_down', -pitch)])
 			elif pitch > 0:
 				arg = f'pitch_up(angle={pitch:0.4f})'
-				cmd=f"\t{arg:<54}#'&' : {rule} Pitch"
+				cmd=Cmd(f"\t{arg:<54}#'&' : {rule} Pitch",
+						[self.op('pitch_up', pitch)])
 		return cmd	
 	def Turn_left(self, p):
 		cmd = None
@@ -765,7 +1066,8 @@ class L_NAP:		# class name is the same as this import file name
 			if turn_left != 0:
 				rule = p['rule'] if 'rule' in p else ''	
 				arg = f'turn_left(angle={turn_left:0.4f})'
-				cmd=f"\t{arg:<54}#'+' : {rule} Turn_left"
+				cmd=Cmd(f"\t{arg:<54}#'+' : {rule} Turn_left",
+						[self.op('turn_left', turn_left)])
 		return cmd
 	def Tl(self, p):
 		return self.Turn_left(p) 
@@ -776,7 +1078,8 @@ class L_NAP:		# class name is the same as this import file name
 			if turn_right != 0:				
 				rule = p['rule'] if 'rule' in p else ''	
 				arg = f'turn_right(angle={turn_right:0.4f})'
-				cmd=f"\t{arg:<54}#'+' : {rule} Turn_right"
+				cmd=Cmd(f"\t{arg:<54}#'+' : {rule} Turn_right",
+						[self.op('turn_right', turn_right)])
 		return cmd
 	def Tr(self, p):
 		return self.Turn_right(p) 
@@ -787,10 +1090,12 @@ class L_NAP:		# class name is the same as this import file name
 			rule = p['rule'] if 'rule' in p else ''
 			if turn > 0:	
 				arg = f'turn_left(angle={turn:0.4f})'
-				cmd=f"\t{arg:<54}#'+' : {rule} Turn_left"
+				cmd=Cmd(f"\t{arg:<54}#'+' : {rule} Turn_left",
+						[self.op('turn_left', turn)])
 			elif turn < 0:	
 				arg = f'turn_right(angle={-turn:0.4f})'
-				cmd=f"\t{arg:<54}#'+' : {rule} Turn_right"
+				cmd=Cmd(f"\t{arg:<54}#'+' : {rule} Turn_right",
+						[self.op('turn_right', -turn)])
 		return cmd
 	def Roll(self, p):
 		cmd = None
@@ -800,10 +1105,12 @@ class L_NAP:		# class name is the same as this import file name
 
 			if roll < 0:
 				arg = f'roll_right(angle={roll:0.4f})'
-				cmd=f"\t{arg:<54}#'/' : {rule} Roll"
+				cmd=Cmd(f"\t{arg:<54}#'/' : {rule} Roll",
+						[self.op('roll_right', roll)])
 			elif roll > 0:
 				arg = f'roll_left(angle={roll:0.4f})'
-				cmd=f"\t{arg:<54}#'\\' : {rule} Roll"
+				cmd=Cmd(f"\t{arg:<54}#'\\' : {rule} Roll",
+						[self.op('roll_left', roll)])
 		return cmd	
 			
 	def	Object(self, p):
@@ -815,7 +1122,8 @@ class L_NAP:		# class name is the same as this import file name
 			rule = p['rule'] if 'rule' in p else '??'		
 
 			arg = f'draw_obj("{ofile}", scale=({sx:0.4f},{sy:0.4f},{sz:0.4f}))'
-			cmd=f"\t{arg:<54}"f"#'~' : {rule} Object" 
+			cmd=Cmd(f"\t{arg:<54}"f"#'~' : {rule} Object",
+					[self.op('draw_obj', self.object_index(ofile), sx, sy, sz)])
 		return cmd		
 #-----------------------------------------------------------------------
 # Pre-defined ancilliary functions
@@ -823,19 +1131,41 @@ class L_NAP:		# class name is the same as this import file name
 	def Save(self,p):
 		#self.L += 1
 		arg = f'save()'
-		cmd=f"\t{arg:<54}#'[' : save"	
+		cmd=Cmd(f"\t{arg:<54}#'[' : save", [self.op('save')])
 		return cmd
 	def Restore(self,p):
 		#self.L += 1
 		arg = f'restore()'
-		cmd=f"\t{arg:<54}#']' : restore"	
+		cmd=Cmd(f"\t{arg:<54}#']' : restore", [self.op('restore')])
 		return cmd
+	#
+	# A cmd as (opcode, args), with args rounded as in the cmds text
+	#
+	def op(self, name, *args):
+		return (OPCODE[name], tuple(round(float(a), 4) for a in args))
+	#
+	# The index of an object name, such as "Grain", in self.objects
+	#
+	def object_index(self, name):
+		if name not in self.objects:
+			self.objects.append(name)
+		return self.objects.index(name)
 	def Prev(self, string):
 		""" If the rule following the current rule is string """
 		return True
 	def Next(self, string):
 		""" If the rule following the current rule is string """
 		return True
+#
+# The L_NAP object and axiom of grow_plants(), shared with the forked
+# Pool workers, which each grow one shard of plants.
+#
+shared = {}
+
+def grow_shard(shard):
+	first, count, filename = shard
+	return shared['L_NAP'].grow_fragment(shared['axiom'], first, count, filename)
+
 # Dummy routines used in basic rule definitions which are translated to
 # actual rule expansion code in same-named object routines.
 def Curve(p):		pass
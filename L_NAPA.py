@@ -24,32 +24,53 @@
 #
 # $ python3.7 L_NAPA.py
 #
+# With 'plant_seed' (or 'workers') set in L_NAPA_p.py, each plant is 
+# seeded from the seed and its plant number alone, and any one plant, 
+# such as plant 40123, can be regrown to "L_NAPA_40123.cmds" thus:
+#
+# $ python3.7 L_NAPA.py 40123
+#
+# A run without a 'seed' draws one, printed and recorded in the first
+# "# plant_seed: <seed>" line of its cmds and .idx files, from which 
+# one of its plants is regrown, or which must be given if the .idx file
+# is not present:
+#
+# $ python3.7 L_NAPA.py 40123 <seed>
+#
 
 """ Import the L_NAP application and the L_NAPA_p parameters """
+import sys
 from L_NAP import *
 from L_NAPA_p import *
 
-""" Initialise plant object L_NAPA with its parameters """
-L_NAPA = L_NAP("L_NAPA_p") 
+""" Initialise plant object L_NAPA with its parameters, for all plants
+or for just the one plant number given on the command line """
+plantnr = int(sys.argv[1]) if len(sys.argv) > 1 else None
+seed = int(sys.argv[2]) if len(sys.argv) > 2 else None
+L_NAPA = L_NAP("L_NAPA_p", plantnr=plantnr, seed=seed) 
 
-""" Define all the L_NAPA production rules """	
+""" Define all the L_NAPA production rules, each bound to its _p fn """	
+@L_NAPA.rule
 def Axiom():		L_NAPA(Stalk, GrainSpace)
 
+@L_NAPA.rule
 def Stalk():		L_NAPA(Curve) 
 
+@L_NAPA.rule
 def GrainSpace():	L_NAPA(Pitch, Turn, Roll, Draw, Grain, GrainSpace)
 
+@L_NAPA.rule
 def Grain():		L_NAPA(Save, Pitch, Object, Awn, Restore)		 
 
+@L_NAPA.rule
 def Awn():			L_NAPA(Curve)
 
 
 		
 """ 
 Grow plants in stages starting at Axiom following L_NAPA rules and
-parameters. The parameters also define the number and type of plants.
+parameters. The parameters also define the number and type of plants,
+and the number of parallel 'workers' processes, if any.
 """
-while L_NAPA.next_plant():
-	while L_NAPA.next_stage(Axiom):
-		L_NAPA.grow()
+L_NAPA.grow_plants(Axiom)
 		
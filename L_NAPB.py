@@ -9,7 +9,7 @@
 # 
 # Setup instructions:
 # In /usr/share/blender/scripts/modules
-# we need to have L_NAPB.py, L_NAPC.py and L_NAPX.py, turtle.py 
+# we need to have L_NAPB.py, L_NAPC.py and L_NAPX.py, turtle.py, L_NAP_CMDS.py
 # which must be copied by "sudo cp" from ~/L_NAP/Apps
 #
 # We run Blender 2.79, clear splash screen by left-clicking on it, and
@@ -36,6 +36,14 @@
 # >>> B.Draw("~/L_NAP/Draw/wh_01_020.cmds")
 # >>> 
 #
+# or for a binary cmds file, written by L_NAP with parameter 'cmdb':
+# >>> B.Draw("~/L_NAP/Draw/wh_01_020.cmdb")
+#
+# or for just plants 40000 to 44999, as one of several Blender processes
+# each taking its own range of plants (seeking straight to plant 40000 
+# by the cmds index file "wh_01_020.cmds.idx" written by L_NAP):
+# >>> B.Draw("~/L_NAP/Draw/wh_01_020.cmds", 40000, 44999)
+#
 # OR, when I modify L_NAPb suiably, just run (TODO)
 # $  blender L_NAPb.blend --background --python L_NAPb.py --draw "wh200.cmds:
 #
@@ -46,8 +54,12 @@
 import bpy
 import math
 import os
+import io		# Text lines from a seek to a plant offset
+import gzip		# Read a gzip cmds file (.cmds.gz) of L_NAP cmds_sink "gzip"
 from turtle	import DrawingTurtle 	# Leopold's Drawing turtle 
 import L_NAPC
+from L_NAP_CMDS import CmdbReader, OPS, NARGS	# Binary cmdb cmds
+from L_NAP_CMDS import read_index, plant_offset	# Cmds index
 
 from mathutils import Vector, Matrix
 
@@ -131,11 +143,70 @@ def export(dir="", name="", deselect=False):
 		for obj in objects:
 			obj.select = True
 		
+#
+# Reload turtle module and DrawTurtle, preparing to draw the new plant 
+# PlantNr with the following cmds.
+#
+def new_plant():
+	global dt
+	
+	import turtle, imp
+	imp.reload(turtle)
+	from turtle import DrawingTurtle
+	dt = DrawingTurtle(1, 0)
+	print(f"PlantNr: {PlantNr:04}")
+	#
+	# Remove all previous "Wheat_" objects from the Scene
+	# so as to clear their data usage, before processing
+	# this new plantnr cmds.
+	#
+	remove_startswith_objects(startswith="Wheat_")
+
+#
+# On the finish of plant PlantNr, select the just-created plant, 
+# rename it as Wheat_'PlantNr' and export it to RESULT.
+#
+def finish_plant():
+	obj = bpy.context.active_object
+	if obj.name.startswith("Plan"):
+		obj.select = True
+		old_name = f"{obj.name}"
+		obj.name = f"Wheat_{PlantNr:03}"
+		export(dir=RESULT, deselect=True)
+
+		print(f"{RESULT} {obj.name} created from {old_name}")
+
+#
+# Draw the plants defined in a binary cmdb file, for which the plantNr
+# is >= from_plantnr (and <= to_plantnr), by calling the turtle cmd of 
+# each record opcode with its args, without exec.
+#
+def DrawCmdb(cmdb="", from_plantnr=1, to_plantnr=None):
+	reader = CmdbReader(cmdb)
+	fns = [globals()[name] for name in OPS]
+	obj = OPS.index('draw_obj')
+	
+	for pn, records in reader:
+		if pn < from_plantnr:
+			continue
+		if to_plantnr is not None and pn > to_plantnr:
+			break
+		plantnr(pn)
+		new_plant()
+		for op, args in zip(records['op'].tolist(), records['args'].tolist()):
+			if op == obj:
+				draw_obj(reader.objects[int(args[0])], scale=tuple(args[1:]))
+			else:
+				fns[op](*args[0:NARGS[op]])
+		finish(pn)
+		finish_plant()
+	reader.close()
+
 #
 # Draw the plants defined in drawing cmds. for which the plantNr
-# is >= from_plantnr.
+# is >= from_plantnr, and <= to_plantnr if given.
 #
-def Draw(cmds="", from_plantnr=1):
+def Draw(cmds="", from_plantnr=1, to_plantnr=None):
 	
 	""" Draw a 3D plant as a series of connected objects by 
 	executing all the turtle commands, which follow a tab character,
@@ -144,6 +215,8 @@ def Draw(cmds="", from_plantnr=1):
 	"""
 	global dt, PlantNr, ClassNr, Parameters
 	
+	if cmds.endswith(".cmdb"):
+		return DrawCmdb(cmds, from_plantnr, to_plantnr)
 
 	#if bpy.context.object.mode == 'EDIT':
 	#    bpy.ops.object.mode_set(mode='OBJECT')
@@ -152,7 +225,18 @@ def Draw(cmds="", from_plantnr=1):
 	# Start from given plantnr
 	Skipping = False
 
-	with open(cmds) as commands:
+	# Seek straight to from_plantnr by the cmds index file, if present, 
+	# instead of Skipping all the cmds of the previous plants.
+	offset = 0
+	if os.path.exists(cmds + ".idx"):
+		offset = plant_offset(read_index(cmds + ".idx"), from_plantnr)
+		if offset is None:
+			return
+		
+	opener = gzip.open if cmds.endswith(".gz") else open
+	with opener(cmds, "rb") as file:
+		file.seek(offset)
+		commands = io.TextIOWrapper(file)
 		
 		for command in commands:
 			if not finished and len(command) > 1 and command[0] == '\t':
@@ -187,23 +271,17 @@ def Draw(cmds="", from_plantnr=1):
 					#
 					if cmd.startswith("plantnr"):
 						
+						# Stop after the plant at to_plantnr
+						if to_plantnr is not None and PlantNr > to_plantnr:
+							finished = True
+							break
+							
 						Skipping = PlantNr < from_plantnr
 						if Skipping:
 							# Skip until finish of current plant model
 							pass
 						else:
-							
-							import turtle, imp
-							imp.reload(turtle)
-							from turtle import DrawingTurtle
-							dt = DrawingTurtle(1, 0)
-							print(f"PlantNr: {PlantNr:04}")
-							#
-							# Remove all previous "Wheat_" objects from the Scene
-							# so as to clear their data usage, before processing
-							# this new plantnr cmds.
-							#
-							remove_startswith_objects(startswith="Wheat_")
+							new_plant()
 						
 					#
 					# On the finish cmd of a Plant, we can process 
@@ -214,16 +292,7 @@ def Draw(cmds="", from_plantnr=1):
 						if Skipping:
 							pass
 						else:
-							# Select just-created plant and rename as
-							# Wheat_'PlantNr'
-							obj = bpy.context.active_object
-							if obj.name.startswith("Plan"):
-								obj.select = True
-								old_name = f"{obj.name}"
-								obj.name = f"Wheat_{PlantNr:03}"
-								export(dir=RESULT, deselect=True)
-
-								print(f"{RESULT} {obj.name} created from {old_name}")
+							finish_plant()
 					
 	
 							
@@ -15,7 +15,10 @@
 # Input:   VIEW   - Synthetic Image view files
 # Output:  RESULT - Json Metadata files
 #          TEMP   - Png files showing result view images with 
-#                   attached bounding boxes, masks and captions
+#                   attached bounding boxes, masks and captions,
+#                   for 1 in QA_EVERY views
+#          DATASET - The consolidated Json dataset of all views, 
+#                   by L_NAP_DATASET.py, if not ""
 #
 # After the run the RESULT files should be moved to META
 # 
@@ -24,17 +27,21 @@ from skimage.io import imread
 from skimage.color import rgb2gray, rgba2rgb
 from skimage import measure
 
-import matplotlib.pyplot as plt
-from matplotlib.patches import Rectangle
-import copy
+import cv2		# Draw and write the QA overlay images
 
 import sys
 import os	# Operating system: used for file I/O
 import json	# Create a json file
+import time	# Stage timings
+import hashlib	# Content hashes of view files in the manifest
+from concurrent.futures import ProcessPoolExecutor, wait, as_completed, \
+                               FIRST_COMPLETED
 
 import numpy as np
 
-from L_NAP_DIRS import *    # VIEW, RESULT, TEMP
+from L_NAP_DIRS import *    # VIEW, RESULT, TEMP, META
+from L_NAP_DATASET import OrderedDatasetWriter, dataset_files, iter_dataset
+import L_NAP_RLE
 pass
 
 
@@ -45,6 +52,41 @@ THE_ONE = "Wheat_0074_131_022.jpg"
 # and stop.
 LIMIT = -1         # This means NO limit
 
+# WORKERS is the number of parallel processes annotating views, and
+# IN_FLIGHT the most views submitted to them at any time.
+WORKERS = 1        # This means serial
+IN_FLIGHT = 0      # This means 4 views per worker
+
+# INCREMENTAL means skip the views already annotated, as recorded in 
+# the MANIFEST, of a json line per annotated view (file_name, image_id,
+# size, mtime, hash, json), appended as each view is done, so that a 
+# rerun only annotates new or changed views, and resumes after a crash.
+# An unchanged view whose image_id has moved, as views sorted before it
+# are added or removed, only has its image_id rewritten. The manifest
+# also records the annotation config (RLE_FORMAT, QA_EVERY and the
+# threshold), and a run of another config annotates all views again.
+INCREMENTAL = True
+MANIFEST = os.path.join(TEMP, "L_NAPD_manifest.jsonl")
+
+# DATASET is the consolidated Json dataset file, of all views, written
+# as they are annotated, in shards of SHARD views if SHARD > 0.
+# VIEW_JSONS means also write a Json file per view to RESULT.
+DATASET = os.path.join(RESULT, "L_NAPD_dataset.json")
+SHARD = 0          # This means one file
+VIEW_JSONS = True
+
+# RLE_FORMAT of the segmentation mask counts, "runs" of (start, length)
+# pairs, or "coco" compressed COCO RLE
+RLE_FORMAT = "runs"
+
+# QA_EVERY means write the QA overlay png to TEMP for only 1 in every
+# QA_EVERY views (by image_id), and never if 0.
+QA_EVERY = 1
+
+# THRESHOLD of the view mask, as computed by annotate_view, to be 
+# changed with it, as it is recorded in the manifest
+THRESHOLD = "corners mean"
+
 def save_data(data, out_path):
     """
     Write data as a dict to given json file, at out_path, and
@@ -71,31 +113,11 @@ def image_data(image_id, in_path, image_width, image_height,
     a bounding box, and a segmentation RLE mask.
     """
     #
-    # Each RLE run is a sequence of consecutive pixels from a given
-    # flattened-mask-x-start and of a given x-length in pixels.
-    # For example runs == array([322,66, 1286,64, 2243,62, ...],
-    # dtype=int32) is three runs of (flattened-x-start, x-length) of
-    # (322,66), (1283,64), (2243,62).
-    #
-    flat_mask = np.concatenate([[0], mask.reshape(-1), [0]])
-    rle_runs = np.where(flat_mask[1:] != flat_mask[:-1])[0] + 1
-    rle_runs[1::2] -= rle_runs[::2]
-    rle_runs[0::2] -= 1 # reduce each start index to compensate for 
-                        # leading [0] concatenate above
+    # The mask is RLE encoded by L_NAP_RLE, by default as runs of 
+    # (flattened-x-start, x-length) pairs, where a run from one y-row 
+    # may continue onto the next y-row, which L_NAPE must allow for.
     #
-    # NOTE: In fact if a run from one y-row continues onto the next 
-    # y-row it is incorrectly taken as the SAME run. 
-    # If we expect runs to be separate then this is incorrect, 
-    # but if we correctly reverse the process, when the array
-    # is unflattened, then the runs are again separate.
-    # This "error" is important if we use the runs to show 
-    # a mask-outline, as in L_NAPe.py, when we must check for overruns
-    # at the end of each run, where pixels would be placed beyond 
-    # or at x_width and cause L_NAPe.py to crash!
-    # 
-    
-    rle_str = ' '.join(str(x) for x in rle_runs)
-    rle_list = rle_runs.tolist()
+    segmentation = L_NAP_RLE.encode(mask, RLE_FORMAT)
     
     #x1, y1 = topleft
     
@@ -114,102 +136,377 @@ def image_data(image_id, in_path, image_width, image_height,
 		'category_id':	category,
         'bbox':         [box[0], box[1], box[2], box[3]],
         'bbox_mode':    0,
-        'segmentation': 
-            {
-            'size':   	[image_height, image_width],
-            'counts': 	rle_list 
-            }
+        'segmentation': segmentation
         })
 
     return data
 
-#
-# Create a new_filename from old_filename with the given bounding boxes 
-# placed on it for view 
-#	   
-def save_with_box_and_mask(image_id, in_path, out_base, 
-                             box, mask, grain_rows):
-	
-    # get coordinates as int type
-    # and calculate width and height of the box
+def overlay_image(image, box, mask, caption):
+    """
+    Return a uint8 RGB copy of image with a white copy of the box mask
+    placed beside the box, and the box drawn in red, with the caption 
+    inside its top left, if the box is not empty
+    """
     x1, y1, x2, y2 = box
     box_width, box_height = x2 - x1, y2 - y1
     
-    # load the image (zero indicates png file with no header checking)
-    # and make a real copy to data2, which will become a mask in a moment
-    data = plt.imread(in_path, 0)
-    data2 = copy.deepcopy(data)
-    
-    (image_height, image_width, channels) = data.shape
-    #--print (f"Image_width: {image_width}, Image_height: {image_height}")
+    if image.ndim == 2:
+        overlay = np.dstack([image, image, image])
+    else:
+        overlay = image[:, :, 0:3].copy()
+    if overlay.dtype != np.uint8:
+        overlay = (overlay * 255).clip(0, 255).astype(np.uint8)
+    image_height, image_width = overlay.shape[0:2]
     
     # Offset the mask image 10 pixels left or right of the view image
     off = box_width+10
     if x1-off < 0:
         off = -off
     #
-    # Place a white mask as data2 beside data (for each y-column),
+    # Place a white mask beside the view, clipped to the image
     #
-    y = y1
-    while y <= y2:
-        x = x1
-        while x <= x2:
-            if mask[y][x] == 1:
-                data2[y][x-off][0] = 255
-                data2[y][x-off][1] = 255
-                data2[y][x-off][2] = 255
-            x += 1
-        y += 1
+    ys, xs = np.nonzero(mask[y1:y2+1, x1:x2+1] == 1)
+    ys, xs = ys + y1, xs + x1 - off
+    inside = (xs >= 0) & (xs < image_width)
+    overlay[ys[inside], xs[inside]] = 255
     
-    # load the extended image (mask beside view image)
-    plt.imshow(data2)
-    # get the context for drawing boxes
-    cx = plt.gca()
+    if box_width > 0 and box_height > 0:
+        cv2.rectangle(overlay, (int(x1), int(y1)), (int(x2), int(y2)), 
+                      (255, 0, 0), 1)
+        (text_width, text_height), _ = cv2.getTextSize(caption, 
+                                    cv2.FONT_HERSHEY_SIMPLEX, 0.4, 1)
+        cv2.putText(overlay, caption, (int(x1) + 2, int(y1) + text_height + 2),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.4, (255, 255, 255), 1, 
+                    cv2.LINE_AA)
+    return overlay
 
-    # plot box on image
+#
+# Return the image data of the given view image, with its bounding box
+# and mask, and save a QA overlay of them on the view to TEMP
+#	   
+def save_with_box_and_mask(image_id, image, in_path, out_base, 
+                             box, mask, grain_rows):
+	
+    # get coordinates as int type
+    # and calculate width and height of the box
+    x1, y1, x2, y2 = box
+    box_width, box_height = x2 - x1, y2 - y1
+    
+    image_height, image_width = image.shape[0:2]
+    #--print (f"Image_width: {image_width}, Image_height: {image_height}")
     
     data = {}
-
-    # if possible create the shape, and add box view image in the context
+    caption = f"{grain_rows}"
     if box_width > 0 and box_height > 0:
-        rect = Rectangle((x1, y1), box_width, box_height, fill=False, color='red')
-    
-        # draw the box with view number as caption
-        cx.add_patch(rect)
-        caption = f"{grain_rows}"
-        
-        # Add view number onto image context top left, for identification
-        cx.text(x1, y1, caption, size=7.5, verticalalignment='top',
-                color='w', backgroundcolor="none")
- 
         # Write out to Json file for Detectron2 data
         category = int(grain_rows)
         
         data = image_data(
                 image_id, in_path, image_width, image_height, 
                 box, mask, category)
-		
-    # (show)save the plot, and remove the figure and the plot - 
-    # Must use plt.close('all') here - I found eventually.'
-    out_mask = os.path.join(TEMP, out_base + "_mask.png")
-    plt.savefig(out_mask)
-    fig = plt.figure()
-    fig.clear()
-    plt.clf()
-    plt.close('all')
     
-    out_json = os.path.join(RESULT, out_base + ".json")
-    save_data(data, out_json)
+    if QA_EVERY > 0 and (image_id - 1) % QA_EVERY == 0:
+        overlay = overlay_image(image, box, mask, caption)
+        out_mask = os.path.join(TEMP, out_base + "_mask.png")
+        cv2.imwrite(out_mask, overlay[:, :, ::-1])	# RGB as BGR
+    
+    return data
+    
+def mask_bbox(img, mask_bool):
+    """
+    Return the bounding box (x1, y1, x2, y2) of the True pixels of 
+    mask_bool, and the min and max img value of those pixels, by row and
+    column any() reductions instead of a loop over every pixel.
+    An empty mask gives the box (xlen, ylen, 0, 0) and values 0, 0.
+    """
+    ylen, xlen = mask_bool.shape
+    xs = np.flatnonzero(mask_bool.any(axis=0))
+    ys = np.flatnonzero(mask_bool.any(axis=1))
+    if len(xs) == 0:
+        return (xlen, ylen, 0, 0), 0, 0
+    
+    values = img[mask_bool]
+    box = (int(xs[0]), int(ys[0]), int(xs[-1]), int(ys[-1]))
+    return box, values.min(), values.max()
+    
+#
+# Annotate one view file, in a worker process when WORKERS > 1
+# 
+def annotate_view(job):
+    """
+    Compute and write the bbox and mask of the view file of the given
+    job (image_id, in_dir, in_file), and return its per-stage timings
+    and its image data dict
+    """
+    image_id, in_dir, in_file = job
+    timings = {}
+    
+    t = time.perf_counter()
+    out_base = in_file[:in_file.rfind('.')]
+    in_path = os.path.join(in_dir, in_file)	    
+    print(f"In:  {in_path}")
+    
+    original = imread(in_path)
+    #--python warnimg on: 
+    img = rgb2gray(original)
+    #img = rgb2gray(rgba2rgb(original))
+    timings['read'] = time.perf_counter() - t
+    
+    t = time.perf_counter()
+    ylen, xlen = img.shape
+    
+    # The THRESHOLD, of the mean of the corners
+    threshold = (img[0][0] + img[ylen-1][0] + img[ylen-1][xlen-1] + img[0][xlen-1])/4 
+    mask_bool = img > threshold
+    mask = np.multiply(mask_bool, 1)
+    
+    # bbox itself, and min and max mask values
+    box, vmin, vmax = mask_bbox(img, mask_bool)
+    #
+    # The grain-count is in the filename Wheat_WHNR_GRC_VN.png
+    # where WHNR is wheat head number, GRC is grain count, 
+    # and VN is the view number
+    #
+    grains = int(in_file[11:14])
+    grain_rows = grains / 10.0
+    timings['bbox'] = time.perf_counter() - t
+    
+    t = time.perf_counter()
+    data = save_with_box_and_mask(image_id, original, in_path, out_base, 
+                            box, mask, grain_rows)
+    if VIEW_JSONS:
+        out_json = os.path.join(RESULT, out_base + ".json")
+        save_data(data, out_json)
+    timings['save'] = time.perf_counter() - t
+    return timings, data
+
+def view_jobs(in_dir):
+    """
+    Return the (image_id, in_dir, in_file) job of each sorted-by-name
+    view file (.jpg) in in_dir, to the LIMIT number or just THE_ONE, 
+    so that image_id follows the sorted order, not the completion order
+    """
+    jobs = []
+    for in_file in sorted(os.listdir(in_dir)):
+        if not in_file.endswith('.jpg'):
+            continue
+        if LIMIT != -1 and len(jobs) >= LIMIT:
+            break
+        if THE_ONE != "" and in_file != THE_ONE:
+            continue		# Skip this not THE_ONE file
+        jobs.append((len(jobs) + 1, in_dir, in_file))
+    return jobs
+
+#
+# The manifest of annotated views
+#
+def file_hash(path):
+    """
+    Return the sha1 hex digest of the contents of the file at path
+    """
+    sha1 = hashlib.sha1()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+def annotation_config():
+    """
+    Return the config of the annotations, which all views of a manifest
+    are annotated with
+    """
+    return {'rle_format': RLE_FORMAT, 'qa_every': QA_EVERY, 
+            'threshold': THRESHOLD}
+
+def load_manifest(path):
+    """
+    Return the config and the manifest entries at path as a dict by 
+    view file_name, the last line of a view taking precedence, and 
+    ignoring a line cut short by a crash. The config is None if the
+    manifest has none.
+    """
+    config = None
+    manifest = {}
+    if os.path.exists(path):
+        with open(path) as file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if 'file_name' in entry:
+                    manifest[entry['file_name']] = entry
+                elif 'config' in entry:
+                    config = entry['config']
+    return config, manifest
+
+def save_manifest(config, manifest, path):
+    """
+    Rewrite the manifest at path with its config line and a single line
+    per view
+    """
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as file:
+        file.write(json.dumps({'config': config}) + "\n")
+        for in_file in sorted(manifest):
+            file.write(json.dumps(manifest[in_file]) + "\n")
+    os.replace(tmp_path, path)
+
+def view_entry(job, data):
+    """
+    Return the manifest entry of the annotated view of the given job,
+    with the path of its json file, or None if no data was written
+    """
+    image_id, in_dir, in_file = job
+    in_path = os.path.join(in_dir, in_file)
+    stat = os.stat(in_path)
+    if VIEW_JSONS:
+        out_json = os.path.join(RESULT, in_file[:in_file.rfind('.')] + ".json")
+    else:
+        out_json = DATASET
+    return {
+        'file_name': in_file,
+        'image_id':  image_id,
+        'size':      stat.st_size,
+        'mtime':     stat.st_mtime,
+        'hash':      file_hash(in_path),
+        'json':      out_json if len(data) > 0 else None
+        }
+
+def view_json(entry):
+    """
+    Return the data of the json file of a manifest entry, in RESULT or
+    moved to META, or {} if there is none
+    """
+    for json_path in (entry['json'], 
+                      os.path.join(META, os.path.basename(entry['json']))):
+        if os.path.exists(json_path):
+            with open(json_path) as file:
+                return json.load(file)
+    return {}
+
+def view_changed(entry, job):
+    """
+    Return True if the view of job needs annotating, as it has no 
+    manifest entry, or a missing json file, or its size or mtime differs
+    and so does its hash, but not if only its image_id differs
+    """
+    image_id, in_dir, in_file = job
+    if entry is None:
+        return True
+    if entry['json'] is not None:
+        if VIEW_JSONS:
+            if entry['json'] == DATASET:
+                return True
+            # The json files may have been moved from RESULT to META
+            in_meta = os.path.join(META, os.path.basename(entry['json']))
+            if not os.path.exists(entry['json']) and not os.path.exists(in_meta):
+                return True
+        elif entry['json'] != DATASET or len(dataset_files(DATASET)) == 0:
+            return True
+    in_path = os.path.join(in_dir, in_file)
+    stat = os.stat(in_path)
+    if stat.st_size == entry['size'] and stat.st_mtime == entry['mtime']:
+        return False
+    if stat.st_size != entry['size']:
+        return True
+    if file_hash(in_path) != entry['hash']:
+        return True
+    entry['mtime'] = stat.st_mtime	# Touched, but unchanged
+    return False
+
+def renumber_view(entry, image_id):
+    """
+    Set the image_id of the unchanged view of a manifest entry to the
+    given image_id, also in its json file, in RESULT or moved to META
+    """
+    entry['image_id'] = image_id
+    if entry['json'] is None or entry['json'] == DATASET:
+        return
+    for json_path in (entry['json'], 
+                      os.path.join(META, os.path.basename(entry['json']))):
+        if os.path.exists(json_path):
+            with open(json_path) as file:
+                data = json.load(file)
+            if data.get('image_id') != image_id:
+                data['image_id'] = image_id
+                save_data(data, json_path)
+            return
+
+class Manifest:
+    """
+    The manifest at path of the views annotated with the given config,
+    as a dict of entries by view file_name. The entries of a manifest of
+    another config are dropped, so that all views are annotated again.
+    """
+    def __init__(self, path, config):
+        self.path = path
+        self.config = config
+        recorded, self.entries = load_manifest(path)
+        if recorded != config and len(self.entries) > 0:
+            print(f"Annotation config changed from {recorded}: "
+                  f"all views are annotated again")
+            self.entries = {}
+        self.skipped = set()	# Unchanged views, with data
+        self.held = []		# Entries recorded on close
+        self.file = None
+    
+    def select(self, jobs):
+        """
+        Return the jobs of the views which are new or changed, renumber
+        the moved unchanged views, and open the manifest to record the 
+        annotated views
+        """
+        selected = []
+        renumbered = 0
+        for job in jobs:
+            entry = self.entries.get(job[2])
+            if view_changed(entry, job):
+                selected.append(job)
+                continue
+            if entry['image_id'] != job[0]:
+                renumber_view(entry, job[0])
+                renumbered += 1
+            if entry['json'] is not None:
+                self.skipped.add(job[2])
+        print(f"Skipped {len(jobs) - len(selected)} unchanged views, "
+              f"{renumbered} with a new image_id")
+        save_manifest(self.config, self.entries, self.path)
+        self.file = open(self.path, "a")
+        return selected
     
+    def record(self, job, data):
+        """
+        Record the annotated view of job, at once with VIEW_JSONS, or
+        else on close, as its data is only safely written on close of
+        the dataset
+        """
+        entry = view_entry(job, data)
+        self.entries[job[2]] = entry
+        if VIEW_JSONS:
+            self.file.write(json.dumps(entry) + "\n")
+            self.file.flush()
+        else:
+            self.held.append(entry)
+    
+    def close(self):
+        for entry in self.held:
+            self.file.write(json.dumps(entry) + "\n")
+        self.file.close()
+
 #
 # Run the L_NAPD pipeline
 # ---------------------- 
 def run_pipeline(in_dir):
     """
     Read view files from in_dir compute and write bbox and masks to out_dir,
-    to the LIMIT number
+    to the LIMIT number, by WORKERS processes, with at most IN_FLIGHT 
+    views queued at a time, and print the total time of each stage.
+    If INCREMENTAL only the views which are new or changed since they
+    were recorded in the MANIFEST are annotated.
+    If DATASET the data of all views, annotated or unchanged, is also
+    streamed to the consolidated DATASET file, in image_id order.
     """
-    image_id = 0
     print(f"\n\nin_dir: {in_dir}")
     
     #
@@ -217,94 +514,72 @@ def run_pipeline(in_dir):
     # and calculate bbox and Mask and save to json file,
     # and to new validatation data .png files.
     #
-    nfiles = 0
-    one_done = False
-    for mn, in_file in enumerate(sorted(os.listdir(in_dir)), start=1):
-        
-        i = in_file.rfind('.')
-        ext = in_file[i:]
-        if ext == '.jpg':
-            out_base = in_file[:i]
-        
-            #if in_file.endswith(".png"):
-            # Next view vn of model
-            
-            if LIMIT != -1 and nfiles >= LIMIT:
-                break
-		
-            if THE_ONE != "":
-                 if one_done:		# Finish now since THE_ONE is processed
-                     break
-                 elif in_file == THE_ONE:
-                     one_done = True	# Finish after doing THE_ONE file
-                 else:
-                     continue		# Skip this not THE_ONE file
-		
-            nfiles += 1
-            in_path = os.path.join(in_dir, in_file)	    
-            print(f"In:  {in_path}")
-	    
-            original = imread(in_path)
-            #--python warnimg on: 
-            img = rgb2gray(original)
-            #img = rgb2gray(rgba2rgb(original))
-	    
-            ylen, xlen = img.shape
-	    
-            threshold = (img[0][0] + img[ylen-1][0] + img[ylen-1][xlen-1] + img[0][xlen-1])/4 
-            mask_bool = img > threshold
-            mask = np.multiply(mask_bool, 1)
-	    
-            # bbox itself
-            ybmin = ylen
-            ybmax = 0
-            xbmin = xlen
-            xbmax = 0
-	    
-            vmax = 0
-            vmin = 0
-	    
-            # for each x
-            for x in range(xlen):
-                ymin = ylen
-                ymax = 0
-                for y in range(ylen):
-                    value = img[y][x]
-                    if value > threshold:
-                        if y < ymin:
-                           ymin = y
-                        elif y > ymax:
-                            ymax = y
-			    
-                        if x < xbmin:
-                            xbmin = x
-                        elif x > xbmax:
-                            xbmax = x
-			    
-                        if vmin == 0 or value < vmin:
-                            vmin = value
-                        elif value > vmax:
-                            vmax = value
-			    
-                if ymin < ybmin:
-                    ybmin = ymin
-                elif ymax > ybmax:
-                    ybmax = ymax
-            #
-            # The grain-count is in the filename Wheat_WHNR_GRC_VN.png
-            # where WHNR is wheat head number, GRC is grain count, 
-            # and VN is the view number
-            #
-            box = (xbmin, ybmin, xbmax, ybmax)
-	    
-            grains = int(in_file[11:14])
-            grain_rows = grains / 10.0
-	    
-            image_id += 1
-            save_with_box_and_mask(image_id, in_path, out_base, 
-                                    box, mask, grain_rows)
-            pass
-            
+    all_jobs = jobs = view_jobs(in_dir)
+    nfiles = len(jobs)
+    totals = {}
+    
+    manifest = None
+    skipped = set()
+    if INCREMENTAL:
+        manifest = Manifest(MANIFEST, annotation_config())
+        jobs = manifest.select(all_jobs)
+        skipped = set(manifest.skipped)
+    
+    #
+    # The dataset is written in image_id order, whatever order the views
+    # are annotated in, of the annotated views, and the unchanged views
+    # carried over from the previous dataset, or from their json file
+    # when VIEW_JSONS.
+    #
+    dataset = None
+    if DATASET:
+        if INCREMENTAL and not VIEW_JSONS:
+            # Annotate again the views lost from the dataset
+            lost = skipped - {data['file_name'] 
+                              for data in iter_dataset(DATASET)}
+            jobs = sorted(jobs + [job for job in all_jobs if job[2] in lost])
+            skipped -= lost
+        dataset = OrderedDatasetWriter(DATASET, SHARD, 
+                    [(image_id, in_file) for image_id, _, in_file in all_jobs],
+                    [job[2] for job in jobs], skipped, 
+                    lambda in_file: view_json(manifest.entries[in_file]))
+    
+    def view_done(job, result):
+        timings, data = result
+        for stage in timings:
+            totals[stage] = totals.get(stage, 0.0) + timings[stage]
+        if dataset:
+            dataset.put(job[2], data)
+        if manifest:
+            manifest.record(job, data)
+    
+    if WORKERS <= 1:
+        for job in jobs:
+            view_done(job, annotate_view(job))
+    else:
+        in_flight = IN_FLIGHT if IN_FLIGHT > 0 else 4 * WORKERS
+        with ProcessPoolExecutor(WORKERS) as executor:
+            pending = {}
+            for job in jobs:
+                # Views waiting to be written count as in flight
+                while pending and len(pending) + \
+                        (len(dataset.ready) if dataset else 0) >= in_flight:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        view_done(pending.pop(future), future.result())
+                pending[executor.submit(annotate_view, job)] = job
+            for future in as_completed(pending):
+                view_done(pending[future], future.result())
+    
+    if dataset:
+        for out_path in dataset.close():
+            print(f"Dataset: {out_path}")
+    if manifest:
+        manifest.close()
+    
+    for stage in totals:
+        print(f"Stage {stage}: {totals[stage]:0.2f}s, "
+              f"{totals[stage]/max(len(jobs), 1)*1000:0.1f}ms per view")
     return nfiles
 
 			
@@ -1,25 +1,69 @@
 #
 # Evaluate the Dataset
 #
+# Run:  python L_NAPE.py                - Evaluate real_file
+#       python L_NAPE.py <real file>    - Evaluate the given real file
+#       python L_NAPE.py all [workers]  - Evaluate every real file (.png)
+#                                         in GWCD, by workers processes
+#       python L_NAPE.py metrics        - Measure the detections of the
+#                                         last "all" run against truth
+#
+# Each evaluated real file gives RESULT/<real file>_EVAL.png, with its
+# detected boxes, and in batch RESULT/<real file>_EVAL.json, of its 
+# detections, and RESULT/L_NAPE_summary.json, of all real files.
+#
+# When the ground truth boxes of the real files are in truth_file, the
+# batch detections are measured against them, by L_NAP_METRICS.py, in
+# RESULT/L_NAPE_metrics.json: precision, recall and AP at each IoU 
+# threshold, and their mAP.
+#
+# The synt files are read and prepared once into the template bank
+# bank_file, by L_NAP_BANK.py, and are only read again when synt_files,
+# or any of their view or META files, have changed.
+#
 # import required libraries
+import sys
 import os
 import math
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 import cv2
 import matplotlib.pyplot as plt
 from matplotlib.patches import Rectangle
 
 from L_NAP_DIRS import *    # In: VIEW, META, GWCD; Out: RESULT
+import L_NAP_RLE
+from L_NAP_SCORE import score_map, pyramid_map, ncc_map, scale_template, \
+						local_maxima, METRICS, MAXIMA
+from L_NAP_NMS import nms
+from L_NAP_DATASET import load_json
+from L_NAP_BANK import build_bank, TemplateBank
+from L_NAP_METRICS import load_truth, evaluate_detections, write_report
 pass
 
 #
 # Globals
 #     
-threshold = 0.50	# Minimum iscore
+threshold = 0.50	# Minimum iscore, or correlation for metric "ncc"
 step = 10			# Pixel step on comparing real and synthetic images
 case = 1			# Remove smaller overlap region, 
 					# as opposed to removing lower score (case 2)
+top_k = 0			# Most local maxima kept per synt image, 0 for all
+scales = [1.0]		# Scales of each synt image to search for, 
+					# such as [0.8, 1.0, 1.25]
+pyramid = 0			# Downsampling factor of a coarse to fine search,
+					# such as 4, or 0 to score every position
+metric = "clipped"	# Window score, the "clipped" sum on the step grid,
+					# or "ncc" correlation at every pixel
 log = False
+workers = 1			# Processes evaluating real files in batch
+eval_images = True	# Save the _EVAL.png of each real file in batch
+bank_file = os.path.join(RESULT, "L_NAPE_bank.tpl")	# Template bank
+truth_file = os.path.join(GWCD, "L_NAPE_truth.csv")	# Ground truth boxes,
+					# of image_name and BoxesString, as GWHD
+metrics_file = os.path.join(RESULT, "L_NAPE_metrics.json")
 
 #real_file = "tr_0056_036_01"
 real_file = "tr_0063_023_01"
@@ -47,18 +91,36 @@ synt_files = [
 
 
 #
-# Pre-read Gwcd image data, (TODO: add x and y reflections/rotations)
-#   
-maxi = []
-rf = os.path.join(GWCD, real_file+".png")
-real = cv2.imread(rf, 0)	#Grayscale
-
+# The real image being evaluated, and its size and iscore size N x M,
+# set by read_real()
+#
+real = None
+rx_max, ry_max = 0, 0
+N, M = 0, 0
 
-#real = (real-0).clip(50,None)
+#
+# The template bank of the prepared synt images, and their titles, 
+# loaded once by load_bank(), and shared by all real images
+#
+templates = []
+titles = []
 
-rx_max, ry_max = real.shape
-N = rx_max//step
-M = ry_max//step
+def read_real(real_file):
+	"""
+	Pre-read Gwcd image data, (TODO: add x and y reflections/rotations)
+	"""
+	global real, rx_max, ry_max, N, M
+	rf = os.path.join(GWCD, real_file+".png")
+	real = cv2.imread(rf, 0)	#Grayscale
+	if real is None:
+		raise FileNotFoundError(f"No real image: {rf}")
+	
+	#real = (real-0).clip(50,None)
+	
+	rx_max, ry_max = real.shape
+	N = rx_max//step
+	M = ry_max//step
+	return real
 
 def data_get(filename): 
 	#
@@ -69,15 +131,13 @@ def data_get(filename):
 	if i >= 0:
 		filename = filename[i+1:]
 	in_path = os.path.join(META, filename+".json")
-	with open(in_path, "r") as file:
-		data = file.read()
-		if len(data) > 0:
-			data = eval(data)
-			return data
-	return None
+	
+	# Parsed once, and cached until the file changes, with its masks
+	# left as RLE until decoded by get_mask
+	return load_json(in_path)
 			
-def local_maxima_get():
-	maxima = []
+def local_maxima_get(iscore, synt_shape, name, ms, step=step, mask=None):
+	maxima = local_maxima(iscore, step, synt_shape, name, ms, top_k, mask)
 	
 	return maxima
 
@@ -114,45 +174,57 @@ def display(images, titles=None, cols=4, cmap=None, norm=None,
         i += 1
     plt.show()
 
-def x_limit_plus(limit, x_mid, y_mid, step, x_min, x_max):
-	x_found = x_mid
-	for x in range(x_mid+step, x_max, step):
-		if x > x_max:
-			return x_found 
-		x_found = x
-		if real[x, y_mid] < limit:
-			return x_found
-	return x_found
-			
-def x_limit_minus(limit, x_mid, y_mid, step, x_min, x_max):
-	x_found = x_mid
-	for x in range(x_mid-step, x_min, -step):
-		if x < x_min:
-			return x_found 
-		x_found = x
-		if real[x, y_mid] < limit:
-			return x_found
-	return x_found
-			
-def y_limit_plus(limit, x_mid, y_mid, step, y_min, y_max):
-	y_found = y_mid
-	for y in range(y_mid+step, y_max, step):
-		if y > y_max:
-			return y_found 
-		y_found = y
-		if real[x_mid, y] < limit:
-			return y_found
-	return y_found
+def box_means(image, boxes):
+	"""
+	Return the (B,) mean gray values of image in each of the (B, 4) 
+	boxes (x1, y1, x2, y2), clipped to image, from its integral image,
+	as np.mean(image[y1:y2, x1:x2]), nan for an empty box
+	"""
+	rows, cols = image.shape
+	boxes = np.asarray(boxes, dtype=np.int64).reshape(-1, 4)
+	x1, x2 = boxes[:, 0].clip(0, cols), boxes[:, 2].clip(0, cols)
+	y1, y2 = boxes[:, 1].clip(0, rows), boxes[:, 3].clip(0, rows)
+	x2, y2 = np.maximum(x1, x2), np.maximum(y1, y2)
+	sums = cv2.integral(image, sdepth=cv2.CV_64F)
+	total = sums[y2, x2] - sums[y1, x2] - sums[y2, x1] + sums[y1, x1]
+	area = (x2 - x1) * (y2 - y1)
+	means = np.full(len(boxes), np.nan)
+	np.divide(total, area, out=means, where=area > 0)
+	return means
+
+def limit_walk(lines, mids, limits, step, sign):
+	"""
+	Return, for each profile of the (B, L) lines, walking from its mid
+	by step in the sign direction within (0, L), the first index of a
+	value below its limit, or else the last index walked, or else mid
+	"""
+	B, L = lines.shape
+	mids = np.asarray(mids, dtype=np.int64)
+	walk = mids[:, None] + sign * step * np.arange(1, L//step + 2)
+	valid = (walk > 0) & (walk < L)
+	values = np.take_along_axis(lines, walk.clip(0, L-1), axis=1)
+	below = valid & (values < np.asarray(limits)[:, None])
+	first = below.argmax(axis=1)
+	last = walk.shape[1] - 1 - valid[:, ::-1].argmax(axis=1)
+	found = np.where(valid.any(axis=1), walk[np.arange(B), last], mids)
+	return np.where(below.any(axis=1), walk[np.arange(B), first], found)
+
+def extent_boxes(boxes, limits, step=10):
+	"""
+	Return the (B, 4) extent boxes (x1, y1, x2, y2) of the (B, 4) boxes,
+	out from their mid points on real by step, to where the real column 
+	at y_mid (for x) or row at x_mid (for y) is first below their limits
+	"""
+	boxes = np.asarray(boxes, dtype=np.int64).reshape(-1, 4)
+	x_mid = boxes[:, 0] + (boxes[:, 2] - boxes[:, 0])//2
+	y_mid = boxes[:, 1] + (boxes[:, 3] - boxes[:, 1])//2
+	x_lines = real[:, y_mid.clip(0, ry_max-1)].T
+	y_lines = real[x_mid.clip(0, rx_max-1), :]
+	return np.stack([limit_walk(x_lines, x_mid, limits, step, -1),
+					 limit_walk(y_lines, y_mid, limits, step, -1),
+					 limit_walk(x_lines, x_mid, limits, step, 1),
+					 limit_walk(y_lines, y_mid, limits, step, 1)], axis=1)
 
-def y_limit_minus(limit, x_mid, y_mid, step, y_min, y_max):
-	y_found = y_mid
-	for y in range(y_mid-step, y_min, -step):
-		if y < y_min:
-			return y_found 
-		y_found = y
-		if real[x_mid, y] < limit:
-			return y_found
-	return y_found
 #
 # Create a new tb_ file from old file with the given bounding boxes 
 # placed on it.
@@ -164,44 +236,30 @@ def save_with_boxes(new_file, boxes_list, removed):
      #gray = rgb2gray(data)
      
      ax = plt.gca()
-     nbox = 1
-     for m, box in enumerate(boxes_list):
-         if m not in removed: 
-             x1_str, y1_str, x2_str, y2_str, score, name, area, ms = box
-             y1,x1,y2,x2 = int(y1_str),int(x1_str),int(y2_str),int(x2_str)
-             
-             gray_mean = np.mean(real[y1:y2, x1:x2])
-          
+     kept = [m for m in range(len(boxes_list)) if m not in removed]
+     kept_boxes = boxes_list[kept]
+     boxes = np.stack([kept_boxes['x1'], kept_boxes['y1'], 
+                       kept_boxes['x2'], kept_boxes['y2']], axis=1)
+     
+     # add extent_boxes out from the mid points on real, to below 0.8 of
+     # the box gray means, all at once
+     limits = box_means(real, boxes) * 0.8
+     extents = extent_boxes(boxes, limits, 10)
+     
+     for box, (x1, y1, x2, y2), (ex1, ey1, ex2, ey2) in \
+                                       zip(kept_boxes, boxes, extents):
              width, height = x2 - x1, y2 - y1
              rect = Rectangle((x1, y1), width, height, fill=False, color='red')
 			
              ax.add_patch(rect)
-             caption = f"{ms+1}: {score}%"
+             caption = f"{box['ms']+1}: {box['score']}%"
              ax.text(x1, y1-25, caption, size=8, verticalalignment='top',
 				  color='yellow', backgroundcolor="none")
-
-			 # add extent_box out from from mid point on real
-             x_mid = x1 + width//2
-             y_mid = y1 + height//2
-			 
-             limit = gray_mean * 0.8
-			   
-             x2 = x_limit_plus (limit, x_mid, y_mid, 10, 0, rx_max)
-             x1 = x_limit_minus(limit, x_mid, y_mid, 10, 0, rx_max)
-             y2 = y_limit_plus (limit, x_mid, y_mid, 10, 0, ry_max)
-             y1 = y_limit_minus(limit, x_mid, y_mid, 10, 0, ry_max)
 			 
-             width, height = (x2 - x1, y2 - y1)
-             rect = Rectangle((x1, y1), width, height, fill=False, color='green')
+             width, height = (ex2 - ex1, ey2 - ey1)
+             rect = Rectangle((ex1, ey1), width, height, fill=False, color='green')
 			
              ax.add_patch(rect)
-			 
-             nbox += 1
-             #if nbox > 3:
-             #    break 
-             
-             #if m > 3:
-             #    break #xxxx
 		 
      plt.savefig(new_file)
      fig = plt.figure()
@@ -210,313 +268,363 @@ def save_with_boxes(new_file, boxes_list, removed):
      plt.close('all')
 
 
-def get_mask(segmentatiom):
-
-	counts, y_height, x_width = (0,0,0)
+def get_mask(segmentation):
 	
-	if 'counts' in segmentation:
-		counts = segmentation['counts']
-	if 'size' in segmentation:
-		y_height, x_width = segmentation["size"] 
-			
-	if counts == 0 or y_height == 0 or x_width == 0:
+	if 'counts' not in segmentation or 'size' not in segmentation:
+		return None
+	y_height, x_width = segmentation['size']
+	if y_height == 0 or x_width == 0:
 		return None
 	
 	mask = np.zeros([y_height, x_width, 1], dtype=np.uint8) 
-	#ones = np.ones(x_width, dtype=np.uint8)
+	L_NAP_RLE.decode(segmentation, mask[:, :, 0])
+	
+	# Skip 2 edge pixels all round (but only 1 on the right edge)
+	mask[0:2] = 0
+	mask[y_height-2:] = 0
+	mask[:, 0:2] = 0
+	mask[:, x_width-1:] = 0
 	
-	i = 0
-	while i < len(counts):
-		
-		x_flat = counts[i]
-		i += 1
-		lrun = counts[i]
-		i += 1
-		#np.put(mask, [x_flat, x_flat+lrun], ones[0:lrun], mode='clip')
-		y = x_flat//x_width
-		x = x_flat - y*x_width
-		
-		# Skip 2 edge pixels all round
-		if y == 0 or y == 1 or y == y_height-1 or y == y_height-2:
-			continue
-		
-		if x == 0 or x == 1:
-			x = 2
-		 
-		if x+lrun >= x_width:
-			lrun = x_width - x - 1
-		if lrun <= 0:
-			continue	
-		
-		mask[y][x:x+lrun][0] = 1
- 	
 	return mask
 
+def synt_template(synt, annotation):
+	"""
+	Return the template of an annotation of the synt view image, as the
+	view cropped to its bbox (or else to its mask), with the pixels 
+	outside its segmentation mask, if any, set to 0, or [] if empty
+	"""
+	mask = None
+	if 'segmentation' in annotation:
+		mask = get_mask(annotation['segmentation'])
+	if 'bbox' in annotation:
+		y1,x1, y2,x2 = annotation['bbox']
+	elif mask is not None and mask.any():
+		rows = np.flatnonzero(mask[:, :, 0].any(axis=1))
+		cols = np.flatnonzero(mask[:, :, 0].any(axis=0))
+		x1, x2, y1, y2 = rows[0], rows[-1]+1, cols[0], cols[-1]+1
+	else:
+		return []
+	if y2 < y1 or x2 < x1:
+		return []
+	template = synt[x1:x2, y1:y2]
+	if mask is not None:
+		template = template * mask[x1:x2, y1:y2, 0]
+	return template
+
 #
 # Read synthetic data View file(s) (.jpg)
 #
-synts = []
-titles = []
-for synt_file, itype in synt_files:
-	sf = os.path.join(VIEW, synt_file+".jpg")
-	synt = cv2.imread(sf, 0)
-	
-	data = data_get(synt_file)	
-	if data and 'annotations' in data:
-		annotations = data['annotations']
-		if isinstance(annotations, list):
-			for annotation in annotations:
-				mask = []
-				if 'segmentation' in annotation:
-					mask = get_mask(segmentation)
-				elif 'bbox' in annotation: 
-					y1,x1, y2,x2 = annotation['bbox']
-					if y2 >= y1 and x2 >= x1:
-						mask = synt[x1:x2, y1:y2]
-				if len(mask) > 0:
-					synts.append(mask)
-					name = f"{synt_file[6:]}"
-					if itype != "":
-						name += " --" + itype
-					titles.append(name)
+def read_synts(synt_files):
+	synts = []
+	titles = []
+	categories = []
+	for synt_file, itype in synt_files:
+		sf = os.path.join(VIEW, synt_file+".jpg")
+		synt = cv2.imread(sf, 0)
 		
-print("All image data has been read")
-
-display(synts, titles=titles, cmap="gray", cols=4) 
+		data = data_get(synt_file)	
+		if data and 'annotations' in data:
+			annotations = data['annotations']
+			if isinstance(annotations, list):
+				for annotation in annotations:
+					mask = synt_template(synt, annotation)
+					if len(mask) > 0:
+						synts.append(mask)
+						name = f"{synt_file[6:]}"
+						if itype != "":
+							name += " --" + itype
+						titles.append(name)
+						categories.append(annotation.get('category_id'))
+			
+	print("All image data has been read")
+	return synts, titles, categories
 
-First = True
-#
-# Process images
-#     The value m+1 will show in the recognised image caption which 
-#     synt_file was matched (1-based)
-#
-for ms, (synt_file, itype) in enumerate(synt_files):
-	#data = data_get(synt_file)
-	
-	#y1,x1, y2,x2 = data["annotations"][0]["bbox"]
-	
-	#name = "("+synt_file[0] + synt_file[7:10]+")"	#(W100)
-	
-	synt = synts[ms]
-	
-	#synt = synt[x1:x2, y1:y2] / 2
-	synt = synt / 2
-	
-	synt = (synt -32).clip(0,None)
-	sx_max, sy_max = synt.shape 
-	box_area = sx_max * sy_max
-	
-	synt_mean = np.mean(synt)
-	
-	synt_max = synt_mean * box_area
-	if First:
-		synt_maximus = synt_max
-		#First = False
+def prepare_synts(synts):
+	"""
+	Return the (synt, synt_max, synt_maximus) template of each synt 
+	image, as compared to the real images
+	"""
+	templates = []
+	First = True
+	for ms, synt in enumerate(synts):
+		#synt = synt[x1:x2, y1:y2] / 2
+		synt = synt / 2
 		
-	
-	
-	if synt_max <= 0:
-		synt_max = 1
+		synt = (synt -32).clip(0,None)
+		sx_max, sy_max = synt.shape 
+		box_area = sx_max * sy_max
 		
-	if log:
-		print(f"Synt max: {synt_max:0.2f}\n")
-	synt += 32
-	
-	
-	# Skip partial images for now, but allow Large through
-	#--if itype == "Large":
-	#--	pass
-	#--elif itype != "":
-	#--	break
-	
-	#
-	# Compare this synt image to every sliding window position n x m 
-	# on the real image, at x positions from 0 to rx_max, 
-	# and at y positions 0 to ry_max, with step and stopping short 
-	# of edges, by adding pixel values,on all positions of that real
-	# image sliding window with corresponding synt poisitions, and
-	# setting a score as the mean of the clipped sum.
-	# Skip this position when its score is below the threshold,
-	# otherwise record an iscore percentage (can exceed 100%)
-	#
-	iscore = np.zeros((N, M), dtype=np.uint8)
-	"""
-	for n, x in enumerate(range(0, rx_max-step-sx_max, step)):
+		synt_mean = np.mean(synt)
+		
+		synt_max = synt_mean * box_area
+		if First:
+			synt_maximus = synt_max
+			#First = False
+			
+		if synt_max <= 0:
+			synt_max = 1
+			
 		if log:
-			print(f"\n {x}:", end="")
-		for m, y in enumerate(range(0, ry_max-step-sy_max, step)):
-			real_x = real[x:x+sx_max, y:y+sy_max]/2
+			print(f"Synt max: {synt_max:0.2f}\n")
+		synt += 32
+		templates.append((synt, synt_max, synt_maximus))
+	return templates
+
+def bank_sources(synt_files):
 	"""
-	for n, x in enumerate(range(0, rx_max-step, step)):
-		if log:
-			print(f"\n {x}:", end="")
-		for m, y in enumerate(range(0, ry_max-step, step)):
-			if x+sx_max <= rx_max and y+sy_max <= ry_max:
-				real_x = real[x:x+sx_max, y:y+sy_max]/2
+	Return the synt files, and the mtimes of their view and META files,
+	which a template bank is built from
+	"""
+	sources = []
+	for synt_file, itype in synt_files:
+		mtimes = []
+		for path in (os.path.join(VIEW, synt_file+".jpg"), 
+					 os.path.join(META, synt_file+".json")):
+			mtimes.append(os.stat(path).st_mtime_ns if os.path.exists(path) else 0)
+		sources.append([synt_file, itype] + mtimes)
+	return sources
+
+def load_bank(synt_files, bank_file):
+	"""
+	Return the TemplateBank of synt_files at bank_file, building it if 
+	it is missing or out of date
+	"""
+	sources = bank_sources(synt_files)
+	if os.path.exists(bank_file):
+		bank = TemplateBank(bank_file)
+		if bank.sources == sources:
+			return bank
+	synts, synt_titles, categories = read_synts(synt_files)
+	build_bank(bank_file, prepare_synts(synts), synt_titles, categories, sources)
+	print(f"Produced: {bank_file}")
+	return TemplateBank(bank_file)
+
+def evaluate(real_file, templates, titles, eval_image=True):
+	"""
+	Find the synt templates in the real_file image, and return the 
+	local maxima maxi, and the set of indexes of those removed as 
+	overlapping, saving them on the real image to RESULT if eval_image
+	"""
+	if metric not in METRICS:
+		raise ValueError(f"Unknown metric: {metric}, not one of {METRICS}")
+	read_real(real_file)
+	maxi = []			# Of the local maxima of each synt image
+	#
+	# Process images
+	#     The value m+1 will show in the recognised image caption which 
+	#     synt_file was matched (1-based)
+	#
+	for ms, (synt, synt_max, synt_maximus) in enumerate(templates):
+		
+		# Skip partial images for now, but allow Large through
+		#--if itype == "Large":
+		#--	pass
+		#--elif itype != "":
+		#--	break
+		
+		#
+		# Compare this synt image to every sliding window position n x m 
+		# on the real image, at x positions from 0 to rx_max, 
+		# and at y positions 0 to ry_max, with step and stopping short 
+		# of edges, by adding pixel values,on all positions of that real
+		# image sliding window with corresponding synt poisitions, and
+		# setting a score as the mean of the clipped sum.
+		# Skip this position when its score is below the threshold,
+		# otherwise record an iscore percentage (can exceed 100%)
+		# All positions are scored at once by L_NAP_SCORE.score_map, or
+		# coarse to fine by L_NAP_SCORE.pyramid_map if pyramid > 1.
+		# The synt image is searched at each of its scales, with its
+		# scores relative to its area at that scale.
+		# With metric "ncc", the score is instead the normalized 
+		# cross-correlation of synt with the window, by 
+		# L_NAP_SCORE.ncc_map, at every pixel (step 1) of the windows
+		# inside the real image.
+		#
+		for scale in scales:
+			synt_s = scale_template(synt, scale)
+			area_ratio = synt_s.size / synt.size
+			score_step = step
+			refined = None		# All cells, but of pyramid_map
+			if metric == "ncc":
+				score_step = 1
+				iscore = ncc_map(real, synt_s, score_step, threshold)
+			elif pyramid > 1:
+				iscore, refined = pyramid_map(real, synt_s, step, 
+							threshold * synt_max * area_ratio, 
+							synt_maximus * area_ratio, (N, M), pyramid)
 			else:
-				# at the right edge and bottom edge we move only valid
-				# pixels into a pre-filled zero array real_x
-				real_x = np.zeros((sx_max,sy_max), dtype=np.uint8)
-				sx_m = sx_max
-				if x+sx_m > rx_max:
-					sx_m = rx_max - x
-				sy_m = sy_max
-				if y+sy_m > ry_max:
-					sy_m = ry_max - y
-				real_x[0:sx_m, 0:sy_m] = real[x:x+sx_m, y:y+sy_m]/2
-				
-			combine = real_x + synt
-			clipped = combine - 128
-			clipped = clipped.clip(0, None)
-			score = np.mean(clipped) * box_area
+				iscore = score_map(real, synt_s, step, 
+							threshold * synt_max * area_ratio, 
+							synt_maximus * area_ratio, (N, M))
+			if log:
+				for row in iscore:
+					print(" ".join(f"{i:03}" if i > 0 else "   " for i in row))
+			
+			#
+			# Find local maxima into maxi of the iscore matrix, by comparing 
+			# each value with its above and below, and its diagonally adjacent
+			# scores. (8 comparsons), after checking that ii is not zero.
+			# Then compute the bounding yxbox, with score, name, and box area.
+			# thrown in for good measure. 
+			#
+			maxi.append(local_maxima_get(iscore, synt_s.shape, titles[ms], ms,
+										 score_step, refined))
+		
+		#---plt.imshow(synt, cmap="gray", vmin=0, vmax=127), plt.show()
 	
-			if score < threshold * synt_max:
-				pass	#iscore[x,y] = 0		
-				if log:
-					print("    ", end ="")
-			else:
-				iscore[n,m] = int(score/synt_maximus*100)
-				i = iscore[n,m]
-				if log:
-					print(f"{i:03} ", end ="")
-				
-				#plt.imshow(combine, cmap="gray", vmin=0, vmax=255), plt.show()
-	if log:
-		print("")
+	if len(maxi) == 0:
+		# No templates, so no boxes
+		return np.zeros(0, dtype=MAXIMA), set()
+	maxi = np.concatenate(maxi)
 	
 	#
-	# Find local maxima into maxi of the iscore matrix, by comparing 
-	# each value with its above and below, and its diagonally adjacent
-	# scores. (8 comparsons), after checking that ii is not zero.
-	# Then compute the bounding yxbox, with score, name, and box area.
-	# thrown in for good measure. 
-	#
-	# TODO: We must use a proper numpy np.where function here instead
-	# of individual comparisons.
+	# Remove overlapping boxes (more than allowed_overlap)
+	# either smaller region (case 1), or lower scoring region (case 2),
+	# or a combination of the two factors (case 3), by L_NAP_NMS.nms
+	# TODO: Instead we always compare large synt images first and REMOVE 
+	# them from the real image, and then proceed to small sized 
+	# (smaller box area) synt images, removing then and moving on to yet 
+	# Thus we hope to find even quite smnall real wheat heads, when we 
+	# can also reduce the threshold, to "scrape-in" the last wheat heads.
 	#
-	for n in range(1,N-1):
-		for m in range(1,M-1):
-			i = iscore[n,m]
-			if i > 0 and \
-				i >= iscore[n,m+1]   and i >= iscore[n,m-1] and \
-				i >= iscore[n+1,m]   and i >= iscore[n-1,m] and \
-				i >= iscore[n+1,m+1] and i >= iscore[n+1,m-1] and \
-				i >= iscore[n-1,m+1] and i >= iscore[n-1,m-1]:
-
-				box = (step*n, step*m, step*n + sx_max, step*m + sy_max)
-				yxbox = box[1], box[0], box[3], box[2], i, name, box_area, ms
-				maxi.append(yxbox)
-				
-	xxx=1
+	allowed_IoU = 0.2
+	boxes = np.stack([maxi['x1'], maxi['y1'], maxi['x2'], maxi['y2']], axis=1)
+	keep = nms(boxes, maxi['score'], maxi['area'], case, allowed_IoU)
+	removed = set(range(len(maxi))) - set(keep.tolist())
 	
-	#---plt.imshow(synt, cmap="gray", vmin=0, vmax=127), plt.show()
-
-	#plt.imshow(combine, cmap="gray", vmin=0, vmax=255), plt.show()
+	if eval_image:
+		rf_out = os.path.join(RESULT, real_file+"_EVAL.png")
+		save_with_boxes(rf_out, maxi, removed)
+		print(f"Produced: {rf_out}")
+	return maxi, removed
 
-xxx=2
+def detections_of(maxi, removed):
+	"""
+	Return the list of dicts of the boxes of maxi not removed
+	"""
+	detections = []
+	for m, box in enumerate(maxi):
+		if m not in removed:
+			detections.append({
+				'bbox':  [int(box['x1']), int(box['y1']), 
+						  int(box['x2']), int(box['y2'])],
+				'score': int(box['score']),
+				'name':  str(box['name']),
+				'area':  int(box['area']),
+				'synt':  int(box['ms'])
+				})
+	return detections
 
-def IoU(box1, box2):
-	
-	box1_height = box1[2] - box1[0]
-	box1_width  = box1[3] - box1[1]
-	box1_area   = box1[6]
+#
+# Batch evaluation of the real files in GWCD
+#
+def init_worker(worker_bank_file):
+	"""
+	Load the template bank shared by the real files of a worker
+	"""
+	global templates, titles
+	templates = TemplateBank(worker_bank_file)
+	titles = templates.titles
 
-	box2_height = box2[2] - box2[0]
-	box2_width  = box2[3] - box2[1]
-	box2_area   = box2[6]
+def evaluate_file(real_file):
+	"""
+	Evaluate real_file by the worker templates, write its detections to
+	RESULT/<real_file>_EVAL.json, and return its summary and detections
+	"""
+	t = time.perf_counter()
+	maxi, removed = evaluate(real_file, templates, titles, eval_images)
+	detections = detections_of(maxi, removed)
+	out_path = os.path.join(RESULT, real_file+"_EVAL.json")
+	with open(out_path, "w") as file:
+		json.dump({'real_file': real_file, 'detections': detections}, file)
+	return {
+		'real_file':  real_file,
+		'candidates': len(maxi),
+		'detections': len(detections),
+		'seconds':    round(time.perf_counter() - t, 3)
+		}, detections
+
+def evaluate_all(in_dir=GWCD, workers=1):
+	"""
+	Evaluate every real file (.png) in in_dir, by workers processes,
+	each with the template bank memory-mapped once, and write the 
+	summary of all of them to RESULT/L_NAPE_summary.json, and their
+	metrics if there is a truth_file
+	"""
+	real_files = sorted(f[:-4] for f in os.listdir(in_dir) if f.endswith(".png"))
+	synt_titles = load_bank(synt_files, bank_file).titles
 	
-	union = box1_area + box2_area
-	if union <= 0:
-		return 0
-		
-	x1 = box1[0]
-	x2 = box2[0]
+	t = time.perf_counter()
+	if workers <= 1:
+		init_worker(bank_file)
+		results = [evaluate_file(real_file) for real_file in real_files]
+	else:
+		with ProcessPoolExecutor(workers, initializer=init_worker,
+						initargs=(bank_file,)) as executor:
+			results = list(executor.map(evaluate_file, real_files))
+	summaries = [summary for summary, _ in results]
 	
-	y1 = box1[1]
-	y2 = box2[1]
+	summary = {
+		'real_files': len(real_files),
+		'detections': sum(s['detections'] for s in summaries),
+		'seconds':    round(time.perf_counter() - t, 3),
+		'synt_files': synt_titles,
+		'images':     summaries
+		}
+	out_path = os.path.join(RESULT, "L_NAPE_summary.json")
+	with open(out_path, "w") as file:
+		json.dump(summary, file, indent=4)
+	print(f"Evaluated {len(real_files)} real files, "
+		  f"{summary['detections']} detections, in {summary['seconds']}s")
+	print(f"Produced: {out_path}")
 	
-	if x1 < x2:
-		h = (x1 + box1_height) - x2
-	else:
-		h = (x2 + box2_height) - x1
-		
-	if y1 < y2:
-		w = (y1 + box1_width) - y2
-	else:
-		w = (y2 + box2_width) - y1
-		
-	if h > 0 and w > 0:
-		inter = h * w
-		IoU = inter / union 
-		return IoU
-	else:
+	if os.path.exists(truth_file):
+		measure({real_file: detections for real_file, (_, detections) 
+				 in zip(real_files, results)})
+	return summary
+
+def measure(detections=None):
+	"""
+	Measure the detections, a dict of real file to its detections, or
+	those of RESULT/<real file>_EVAL.json, against truth_file, and 
+	write the report to metrics_file
+	"""
+	if detections is None:
+		detections = {}
+		for f in sorted(os.listdir(RESULT)):
+			if f.endswith("_EVAL.json"):
+				data = load_json(os.path.join(RESULT, f))
+				detections[data['real_file']] = data['detections']
+	report = evaluate_detections(detections, load_truth(truth_file))
+	write_report(report, metrics_file)
+	print(f"mAP {report['mAP']} of {report['images']} real files, "
+		  f"{report['truths']} truths, {report['detections']} detections")
+	for t in report['iou_thresholds']:
+		print(f"  IoU {t['iou']:0.2f}: AP {t['AP']:0.4f}, "
+			  f"precision {t['precision']:0.4f}, recall {t['recall']:0.4f}")
+	print(f"Produced: {metrics_file}")
+	return report
+
+def main():
+	"""
+	Evaluate the real_file, a given real file, or all real files
+	"""
+	if len(sys.argv) > 1 and sys.argv[1] == "all":
+		n = int(sys.argv[2]) if len(sys.argv) > 2 else workers
+		evaluate_all(GWCD, n)
+		return 0
+	if len(sys.argv) > 1 and sys.argv[1] == "metrics":
+		measure()
 		return 0
 	
+	one_file = sys.argv[1] if len(sys.argv) > 1 else real_file
+	bank = load_bank(synt_files, bank_file)
 	
+	display([bank.image(i) for i in range(len(bank))], titles=bank.titles, 
+			cmap="gray", cols=4) 
+	
+	evaluate(one_file, bank, bank.titles)
+	return 0
 
-#
-# Remove overlapping boxes (more than allowed_overlap)
-# with lower scores (NOT considering their area (somehow))
-# TODO: Instead we always compare large synt images first and REMOVE 
-# them from the real image, and then proceed to small sized 
-# (smaller box area) synt images, removing then and moving on to yet 
-# Thus we hope to find even quite smnall real wheat heads, when we 
-# can also reduce the threshold, to "scrape-in" the last wheat heads.
-#
-allowed_IoU = 0.2
-removed = []
-for m1, maxi1 in enumerate(maxi):
-	for m2, maxi2 in enumerate(maxi):
-		if m2 == m1:
-			break
-		# 
-		# If too much intersection over union then 
-		# remoive either smaller region
-		#		      or lower scoring region
-		#             or a combination of the two factors
-		#
-		if IoU(maxi1, maxi2) > allowed_IoU:
-
-			#
-			# decide on either case 1 or case 2, 
-			# based on product of score and area
-			#
-			
-			
-			if case == 3:
-				s1 = math.sqrt(maxi1[6]) * maxi1[4]	#score bias
-				s2 = math.sqrt(maxi2[6]) * maxi2[4]
-				if s1 > s2:
-					if m2 not in removed:
-						removed.append(m2)
-				else:
-					if m1 not in removed:
-						removed.append(m1)
-
-			elif case == 1:
-			
-				# Remove smaller region
-				if maxi1[6] > maxi2[6]:
-					if m2 not in removed:
-						removed.append(m2)
-				else:
-					if m1 not in removed:
-						removed.append(m1)
-			elif case == 2:
-				# Remove lower score
-				if maxi1[4] > maxi2[4]:
-					if m2 not in removed:
-						removed.append(m2)
-				else:
-					if m1 not in removed:
-						removed.append(m1)
-			xc=1
-					
- 
-
-rf_in  = os.path.join(GWCD, real_file+".png")
-rf_out = os.path.join(RESULT, real_file+"_EVAL.png")
-save_with_boxes(rf_out, maxi, removed)
-print(f"Produced: {rf_out}")
-
-
+if __name__ == '__main__':
+	sys.exit(main())
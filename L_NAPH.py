@@ -0,0 +1,323 @@
+#
+# L_NAPH.py
+# ---------
+# Function: Headless turtle interpretation of L_NAPA drawing cmds into
+# 3D plant models (.obj, .mtl), as L_NAPB does in Blender, but with plain
+# Python3 and NumPy only, on any CPU-only Linux box.
+#
+# The same turtle cmds are interpreted: draw, move, turn_left/right,
+# pitch_up/down, roll_left/right, save/restore and draw_obj. The turtle
+# frame is a 3x3 matrix of columns Heading, Left and Up, starting with
+# the Heading up the z axis, and is rotated as in "The Algorithmic
+# Beauty of Plants" (turn about Up, pitch about Left, roll about Heading).
+# The rotation matrices of all cmds of a plant are computed at once;
+# the turtle frame and position are then followed cmd by cmd, as each
+# depends on the last and on the save/restore stack (a few hundred
+# cmds per plant, a small part of the time of writing its model). The
+# cylinders of draw() and the meshes of draw_obj() are then created by
+# batched transforms of a single unit cylinder and object mesh, and
+# each plant is written as one merged Wheat_<PlantNr>.obj and .mtl file.
+#
+# Input:   cmds     - .cmds, .cmds.gz or .cmdb drawing cmds of L_NAPA
+#          obj_dir  - <name>.obj meshes of draw_obj(name), such as a
+#                     Grain.obj (a small ellipsoid if none is found)
+# Output:  out_dir  - Wheat_<PlantNr>.obj and .mtl files (the current
+#                     directory by default)
+#
+# Run with Linux command, for all plants, or plants 1 to 100, into
+# the directory ~/L_NAP/Result:
+#
+# $ python3 L_NAPH.py ~/L_NAP/Draw/wh_01_020.cmdb
+# $ python3 L_NAPH.py ~/L_NAP/Draw/wh_01_020.cmds 1 100 ~/L_NAP/Result
+#
+import sys
+import os
+import re		# Numbers of text cmds
+import gzip		# Read a gzip cmds file (.cmds.gz)
+import numpy as np
+
+from L_NAP_CMDS import CmdbReader, OPCODE	# Binary cmdb cmds
+
+SEGMENTS = 8	# Sides of each drawn cylinder
+NUMBER = re.compile(r"[-+]?\d*\.?\d+(?:[eE][-+]?\d+)?")
+
+#
+# Turtle rotations, as (axis, sign) of each opcode, where axis is
+# 0: Up (turn), 1: Left (pitch), 2: Heading (roll)
+#
+ROTATIONS = {
+	OPCODE['turn_left']:  (0, +1), OPCODE['turn_right']: (0, -1),
+	OPCODE['pitch_down']: (1, +1), OPCODE['pitch_up']:   (1, -1),
+	OPCODE['roll_left']:  (2, +1), OPCODE['roll_right']: (2, -1),
+	}
+
+def rotation_matrices(ops, args):
+	"""
+	Return the (K,3,3) rotation matrices in the turtle frame, of the K
+	cmds given by opcodes ops and args, being identity for non-rotations
+	"""
+	K = len(ops)
+	R = np.zeros((K, 3, 3))
+	R[:] = np.eye(3)
+	for op, (axis, sign) in ROTATIONS.items():
+		k = np.nonzero(ops == op)[0]
+		if len(k) == 0:
+			continue
+		a = np.radians(sign * args[k, 0])
+		c, s = np.cos(a), np.sin(a)
+		# Rows and columns of the frame columns (H, L, U) rotated
+		i, j = [(0, 1), (0, 2), (1, 2)][axis]
+		sg = 1 if axis == 0 else -1		# R_L(a), R_H(a) have -sin above diagonal
+		R[k, i, i] = c
+		R[k, j, j] = c
+		R[k, i, j] = sg * s
+		R[k, j, i] = -sg * s
+	return R
+
+def unit_cylinder(segments=SEGMENTS):
+	"""
+	Return the vertices (as h, l, u turtle coordinates) and triangles of
+	a capped cylinder of unit length and radius along the turtle heading
+	"""
+	a = np.linspace(0, 2*np.pi, segments, endpoint=False)
+	ring = np.stack([np.zeros(segments), np.cos(a), np.sin(a)], axis=1)
+	top = ring + [1, 0, 0]
+	verts = np.concatenate([ring, top, [[0, 0, 0], [1, 0, 0]]])
+
+	i = np.arange(segments)
+	j = (i + 1) % segments
+	b, t = 2*segments, 2*segments + 1	# Cap centres
+	faces = np.concatenate([
+		np.stack([i, j, j + segments], axis=1),
+		np.stack([i, j + segments, i + segments], axis=1),
+		np.stack([np.full(segments, b), j, i], axis=1),
+		np.stack([np.full(segments, t), i + segments, j + segments], axis=1),
+		])
+	return verts, faces
+
+def unit_ellipsoid(n=6):
+	"""
+	Return the vertices and triangles of a default grain object, an
+	ellipsoid of length 1 along its z axis and width 0.5
+	"""
+	lat = np.linspace(0, np.pi, n + 1)[1:-1]
+	lon = np.linspace(0, 2*np.pi, 2*n, endpoint=False)
+	la, lo = np.meshgrid(lat, lon, indexing="ij")
+	verts = np.stack([0.25*np.sin(la)*np.cos(lo), 0.25*np.sin(la)*np.sin(lo),
+					  0.5 - 0.5*np.cos(la)], axis=-1).reshape(-1, 3)
+	verts = np.concatenate([verts, [[0, 0, 0], [0, 0, 1]]])
+
+	m = 2*n
+	faces = []
+	for r in range(n - 2):
+		i = r*m + np.arange(m)
+		j = r*m + (np.arange(m) + 1) % m
+		faces += [np.stack([i, j, j + m], axis=1), np.stack([i, j + m, i + m], axis=1)]
+	i = np.arange(m)
+	j = (i + 1) % m
+	last = (n - 2)*m
+	faces += [np.stack([np.full(m, len(verts)-2), j, i], axis=1),
+			  np.stack([np.full(m, len(verts)-1), last + i, last + j], axis=1)]
+	return verts, np.concatenate(faces)
+
+def load_obj(filename):
+	"""
+	Return the vertices and (fan triangulated) faces of an .obj file
+	"""
+	verts = []
+	faces = []
+	with open(filename) as file:
+		for line in file:
+			fields = line.split()
+			if len(fields) == 0:
+				continue
+			if fields[0] == 'v':
+				verts.append([float(x) for x in fields[1:4]])
+			elif fields[0] == 'f':
+				face = [int(f.split('/')[0]) - 1 for f in fields[1:]]
+				for k in range(1, len(face) - 1):
+					faces.append((face[0], face[k], face[k+1]))
+	return np.array(verts, dtype=float), np.array(faces, dtype=int)
+
+class Objects:
+	""" The draw_obj meshes by name, each loaded once """
+	def __init__(self, obj_dir="."):
+		self.obj_dir = obj_dir
+		self.meshes = {}
+
+	def mesh(self, name):
+		if name not in self.meshes:
+			filename = os.path.join(self.obj_dir, name + ".obj")
+			if os.path.exists(filename):
+				verts, faces = load_obj(filename)
+			else:
+				verts, faces = unit_ellipsoid()
+			# Object x, y, z as turtle Left, Up, Heading
+			self.meshes[name] = (verts[:, [2, 0, 1]], faces)
+		return self.meshes[name]
+
+def interpret(ops, args):
+	"""
+	Interpret the turtle cmds of one plant, given as opcodes ops (K,) and
+	args (K,4), and return the cylinders as (positions, frames, sizes)
+	and objects as (object indexes, positions, frames, scales)
+	"""
+	ops = np.asarray(ops, dtype=int)
+	args = np.asarray(args, dtype=float)
+	R = rotation_matrices(ops, args)
+
+	draw, move = OPCODE['draw'], OPCODE['move']
+	draw_obj = OPCODE['draw_obj']
+	save, restore = OPCODE['save'], OPCODE['restore']
+
+	pos = np.zeros(3)
+	frame = np.array([[0., 0., -1.], [0., 1., 0.], [1., 0., 0.]])	# H=z
+	stack = []
+	cylinders = []
+	objects = []
+	for k, op in enumerate(ops.tolist()):
+		if op in ROTATIONS:
+			frame = frame @ R[k]
+		elif op == draw:
+			length, width = args[k, 0], args[k, 1]
+			cylinders.append((pos, frame, (length, width/2, width/2)))
+			pos = pos + frame[:, 0]*length
+		elif op == move:
+			pos = pos + frame[:, 0]*args[k, 0]
+		elif op == draw_obj:
+			objects.append((int(args[k, 0]), pos, frame, args[k, 1:4]))
+		elif op == save:
+			stack.append((pos, frame))
+		elif op == restore and len(stack) > 0:
+			pos, frame = stack.pop()
+	return cylinders, objects
+
+def instance(verts, faces, positions, frames, scales, base=0):
+	"""
+	Return the world vertices and faces of N instances of a mesh, of
+	local turtle (h, l, u) verts, scaled by scales (N,3), rotated by
+	frames (N,3,3) and placed at positions (N,3), with face indexes
+	offset from base
+	"""
+	N = len(positions)
+	local = verts[None, :, :] * np.asarray(scales)[:, None, :]
+	world = np.einsum('nij,nvj->nvi', np.asarray(frames), local) \
+			+ np.asarray(positions)[:, None, :]
+	offsets = base + len(verts)*np.arange(N)
+	return world.reshape(-1, 3), (faces[None, :, :] + offsets[:, None, None]).reshape(-1, 3)
+
+def write_model(out_dir, plantnr, cylinders, objects, names, meshes):
+	"""
+	Write one plant as a single merged Wheat_<plantnr>.obj and its .mtl
+	"""
+	name = f"Wheat_{plantnr:03}"
+	parts = []		# (material, vertices, faces)
+	base = 0
+	if len(cylinders) > 0:
+		verts, faces = unit_cylinder()
+		positions, frames, sizes = zip(*cylinders)
+		v, f = instance(verts, faces, positions, frames, sizes, base)
+		parts.append(("Stalk", v, f))
+		base += len(v)
+
+	# Batch the objects of each name
+	for index in sorted(set(o[0] for o in objects)):
+		verts, faces = meshes.mesh(names[index])
+		batch = [o for o in objects if o[0] == index]
+		_, positions, frames, scales = zip(*batch)
+		scales = np.asarray(scales)[:, [2, 0, 1]]	# Object z along Heading
+		v, f = instance(verts, faces, positions, frames, scales, base)
+		parts.append((names[index], v, f))
+		base += len(v)
+
+	with open(os.path.join(out_dir, name + ".mtl"), "w") as file:
+		for material, v, f in parts:
+			kd = "0.35 0.55 0.15" if material == "Stalk" else "0.80 0.75 0.35"
+			file.write(f"newmtl {material}\nKd {kd}\nKa 0 0 0\nKs 0 0 0\n\n")
+
+	with open(os.path.join(out_dir, name + ".obj"), "w") as file:
+		file.write(f"mtllib {name}.mtl\no {name}\n")
+		for material, v, f in parts:
+			np.savetxt(file, v, fmt="v %.5f %.5f %.5f")
+		for material, v, f in parts:
+			file.write(f"usemtl {material}\n")
+			np.savetxt(file, f + 1, fmt="f %d %d %d")
+	return name
+
+def read_cmds(cmds):
+	"""
+	Yield (plantnr, ops, args, objects) for each plant of a text cmds
+	file, with objects the list of draw_obj names indexed by args[0]
+	"""
+	names = []
+	plantnr = 0
+	ops, args = [], []
+	opener = gzip.open if cmds.endswith(".gz") else open
+	with opener(cmds, "rt") as commands:
+		for command in commands:
+			if len(command) <= 1 or command[0] != '\t':
+				continue
+			cmd = command[1:].split('#')[0]
+			i = cmd.find('(')
+			if i < 0:
+				continue
+			op, text = cmd[0:i], cmd[i:]
+			if op == 'plantnr':
+				plantnr = int(NUMBER.findall(text)[0])
+				ops, args = [], []
+			elif op == 'finish':
+				yield plantnr, np.array(ops, dtype=int), \
+						np.array(args, dtype=float).reshape(-1, 4), names
+			elif op in OPCODE:
+				if op == 'draw_obj':
+					q = text.split('"')
+					if q[1] not in names:
+						names.append(q[1])
+					values = [names.index(q[1])] + [float(x) for x in NUMBER.findall(q[2])]
+				else:
+					values = [float(x) for x in NUMBER.findall(text)]
+				ops.append(OPCODE[op])
+				args.append((values + [0.0]*4)[0:4])
+
+def read_cmdb(cmdb):
+	""" Yield (plantnr, ops, args, objects) for each plant of a cmdb file """
+	reader = CmdbReader(cmdb)
+	for plantnr, records in reader:
+		yield plantnr, records['op'], records['args'], reader.objects
+	reader.close()
+
+#
+# Draw the plants of the cmds file, for which the plantNr is
+# >= from_plantnr and <= to_plantnr if given, to out_dir
+#
+def Draw(cmds="", from_plantnr=1, to_plantnr=None, out_dir=".", obj_dir="."):
+	os.makedirs(out_dir, exist_ok=True)
+	meshes = Objects(obj_dir)
+	plants = read_cmdb(cmds) if cmds.endswith(".cmdb") else read_cmds(cmds)
+	N = 0
+	for plantnr, ops, args, names in plants:
+		if plantnr < from_plantnr:
+			continue
+		if to_plantnr is not None and plantnr > to_plantnr:
+			break
+		cylinders, objects = interpret(ops, args)
+		name = write_model(out_dir, plantnr, cylinders, objects, names, meshes)
+		print(f"{out_dir} {name} created")
+		N += 1
+	return N
+
+def main():
+	"""
+	Start the L_NAPH pipeline:
+	"""
+	cmds = sys.argv[1]
+	from_plantnr = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+	to_plantnr = int(sys.argv[3]) if len(sys.argv) > 3 else None
+	out_dir = sys.argv[4] if len(sys.argv) > 4 else "."
+	N = Draw(cmds, from_plantnr, to_plantnr, out_dir)
+	print(f"Created {N} model object files")
+
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,107 @@
+#
+# L_NAP_BANK.py
+# -------------
+# Function: A template bank of the prepared synt images of L_NAPE, in
+# a single file, memory-mapped when loaded, so that they are read and
+# prepared only once, however many real images are evaluated.
+#
+# A prepared synt image has half values from 32 to 127.5, so it is
+# stored exactly as the uint8 image 2*synt. The bank file is:
+#
+#   "LNAPTPL1"                 magic
+#   uint64 n, n bytes          json metadata, padded to 8 bytes
+#   uint8 pixels               of all templates, row by row
+#
+# where the metadata has the "sources" the bank was built from, and a
+# dict per template of its "title", "category" (grain count class),
+# "shape", "offset" (in the pixels), "area", "synt_max" and
+# "synt_maximus".
+#
+# A TemplateBank converts each template back to its float synt only on
+# first use, and keeps it, read-only, for all the real images scored by
+# the process.
+#
+import json		# Bank metadata
+import struct	# Pack the metadata size
+import numpy as np
+
+BANK_MAGIC = b"LNAPTPL1"
+
+def build_bank(filename, templates, titles, categories, sources=None):
+	"""
+	Write the (synt, synt_max, synt_maximus) templates, with their
+	titles and categories, to the bank filename
+	"""
+	items = []
+	images = []
+	offset = 0
+	for (synt, synt_max, synt_maximus), title, category in \
+								zip(templates, titles, categories):
+		image = synt * 2
+		if not np.array_equal(image, np.round(image)) or \
+				image.min() < 0 or image.max() > 255:
+			raise ValueError(f"Template {title} is not of half values up to 127.5")
+		images.append(image.astype(np.uint8))
+		items.append({
+			'title':        title,
+			'category':     category,
+			'shape':        list(synt.shape),
+			'offset':       offset,
+			'area':         int(synt.size),
+			'synt_max':     float(synt_max),
+			'synt_maximus': float(synt_maximus)
+			})
+		offset += synt.size
+	meta = json.dumps({'sources': sources, 'templates': items}).encode()
+	meta += b" " * (-len(meta) % 8)
+	with open(filename, "wb") as file:
+		file.write(BANK_MAGIC)
+		file.write(struct.pack("<Q", len(meta)) + meta)
+		for image in images:
+			file.write(image.tobytes())
+
+class TemplateBank:
+	"""
+	A template bank file, as a sequence of (synt, synt_max, synt_maximus)
+	templates, read from its memory-mapped pixels
+	"""
+	def __init__(self, filename):
+		self.filename = filename
+		with open(filename, "rb") as file:
+			if file.read(len(BANK_MAGIC)) != BANK_MAGIC:
+				raise ValueError(f"Not a template bank file: {filename}")
+			n, = struct.unpack("<Q", file.read(8))
+			meta = json.loads(file.read(n))
+		self.sources = meta['sources']
+		self.items = meta['templates']
+		self.titles = [item['title'] for item in self.items]
+		self.categories = [item['category'] for item in self.items]
+		self.synts = [None] * len(self.items)	# Converted on first use
+		npixels = sum(item['area'] for item in self.items)
+		if npixels > 0:
+			self.pixels = np.memmap(filename, dtype=np.uint8, mode="r",
+						offset=len(BANK_MAGIC) + 8 + n, shape=(npixels,))
+		else:
+			self.pixels = np.zeros(0, dtype=np.uint8)
+
+	def __len__(self):
+		return len(self.items)
+
+	def image(self, i):
+		""" The uint8 image 2*synt of the i'th template """
+		item = self.items[i]
+		offset = item['offset']
+		return self.pixels[offset:offset + item['area']].reshape(item['shape'])
+
+	def __getitem__(self, i):
+		""" The (synt, synt_max, synt_maximus) of the i'th template """
+		item = self.items[i]
+		if self.synts[i] is None:
+			synt = self.image(i) / 2
+			synt.setflags(write=False)
+			self.synts[i] = synt
+		return self.synts[i], item['synt_max'], item['synt_maximus']
+
+	def __iter__(self):
+		for i in range(len(self.items)):
+			yield self[i]
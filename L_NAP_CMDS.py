@@ -0,0 +1,281 @@
+#
+# L_NAP_CMDS.py
+# -------------
+# Function: Buffered writer of the drawing cmds produced by L_NAP,
+# for L_NAPA, with pluggable output sinks.
+#
+# The cmds of a plant are accumulated in memory and written to the sink
+# with one write per plant, on flush() at the finish of the plant.
+#
+# Sinks:   "file"   - <name>.cmds text file (default)
+#          "gzip"   - <name>.cmds.gz gzip compressed text file
+#          "memory" - io.StringIO, read back by getvalue(), for tests
+#          "null"   - no output, as when only using L_NAP.iter_plants()
+#
+# In production mode (comments=False) all comment lines, such as the
+# '#->' and '# Plant:' debug lines, blank lines and the trailing
+# '#...' comments of each drawing cmd are dropped on flush, leaving
+# only the tab-indented cmds which L_NAPB executes.
+#
+# A sidecar index file <cmds file>.idx has a line per plant of
+# "plantnr offset lines", the byte offset at which the plant cmds start 
+# in the (uncompressed) cmds text and their number of lines, so that 
+# L_NAPB.Draw can seek straight to a given plant.
+#
+# The base seed of a run with 'plant_seed', from which any one plant 
+# can be regrown, is written by header() as a "# plant_seed: <seed>" 
+# line at the top of the cmds text (kept in production mode), and as 
+# the first line of the index file, read back by index_seed(). Its 
+# presence marks the run as plant seeded.
+#
+# With L_NAP parameter 'cmdb' the structured cmds of each plant are also
+# written to a compact binary <name>.cmdb file, by CmdbWriter, which 
+# L_NAPB reads by CmdbReader, without parsing or exec of cmd text:
+#
+#   "LNAPCMB1"                     magic
+#   records of all plants          op uint8, args 4 x float32 (17 bytes)
+#   uint32 n, n bytes              object names, joined by newlines
+#   uint32 n, n plant index items  plantnr uint32, offset uint64, 
+#                                  count uint32 (of records)
+#   uint64 index offset, "LNAPCMB1"
+#
+import io		# In-memory sink
+import gzip		# Compressed file sink
+import os		# os.devnull as null sink
+import struct	# Pack cmdb sizes and offsets
+import shutil	# Append cmds fragment files
+import numpy as np	# Records of cmdb files
+
+SINKS = ["file", "gzip", "memory", "null"]
+
+#
+# The turtle cmds of L_NAPB, as opcode numbers of structured cmds
+#
+OPS = ['draw', 'move', 'draw_obj', 'turn_left', 'turn_right', 
+	   'pitch_down', 'pitch_up', 'roll_left', 'roll_right', 
+	   'save', 'restore']
+OPCODE = {name: opcode for opcode, name in enumerate(OPS)}
+# The number of args of each opcode
+NARGS = [2, 1, 4, 1, 1, 1, 1, 1, 1, 0, 0]
+
+CMDB_MAGIC = b"LNAPCMB1"
+CMDB_RECORD = np.dtype([('op', '<u1'), ('args', '<f4', (4,))])
+CMDB_INDEX = np.dtype([('plantnr', '<u4'), ('offset', '<u8'), ('count', '<u4')])
+
+def open_sink(filename, sink="file"):
+	"""
+	Open and return the given type of sink for the cmds filename, and
+	the actual filename used (None for a memory or null sink)
+	"""
+	if sink == "file":
+		return open(filename, "w"), filename
+	elif sink == "gzip":
+		filename += ".gz"
+		return gzip.open(filename, "wt"), filename
+	elif sink == "memory":
+		return io.StringIO(), None
+	elif sink == "null":
+		return open(os.devnull, "w"), None
+	raise ValueError(f"Unknown cmds sink: {sink}, not one of {SINKS}")
+
+def strip_comments(text):
+	"""
+	Return text with only its tab-indented cmd lines, each without its
+	trailing comment
+	"""
+	lines = []
+	for line in text.split("\n"):
+		if line.startswith("\t"):
+			i = line.find("#")
+			if i > 0:
+				line = line[0:i].rstrip()
+			lines.append(line)
+	if len(lines) == 0:
+		return ""
+	return "\n".join(lines) + "\n"
+
+class Cmd(str):
+	"""
+	A cmd text line (or lines) which also holds its structured cmds, as
+	a list ops of (opcode, args) tuples
+	"""
+	def __new__(cls, text, ops):
+		cmd = str.__new__(cls, text)
+		cmd.ops = ops
+		return cmd
+
+def read_index(filename):
+	"""
+	Return the (plantnr, offset, lines) tuples of a cmds index file
+	"""
+	index = []
+	with open(filename) as file:
+		for line in file:
+			if line.startswith("#"):
+				continue
+			plantnr, offset, lines = line.split()
+			index.append((int(plantnr), int(offset), int(lines)))
+	return index
+
+def index_seed(filename):
+	"""
+	Return the base seed recorded in a cmds index file, or None if the
+	run was not plant seeded
+	"""
+	with open(filename) as file:
+		line = file.readline()
+	if line.startswith("# plant_seed:"):
+		return int(line.split(":")[1])
+	return None
+
+def plant_offset(index, from_plantnr):
+	"""
+	Return the byte offset of the first plant >= from_plantnr in index,
+	or None if there is no such plant
+	"""
+	for plantnr, offset, lines in index:
+		if plantnr >= from_plantnr:
+			return offset
+	return None
+
+class CmdsWriter:
+	"""
+	A file-like buffer of cmds text, flushed to its sink once per plant,
+	and optionally indexed by plant in the index_filename file
+	"""
+	def __init__(self, sink, comments=True, index_filename=None):
+		self.sink = sink
+		self.comments = comments	# False in production mode
+		self.buffer = []
+		self.index_filename = index_filename
+		self.index = []			# (plantnr, offset, lines) per plant
+		self.offset = 0			# Bytes written to sink
+		self.seed = None		# Base seed of the run, if recorded
+
+	def header(self, seed):
+		""" Record the base seed of the run, at the top of the cmds """
+		self.seed = seed
+		text = f"# plant_seed: {seed}\n"
+		self.sink.write(text)
+		self.offset += len(text.encode())
+
+	def write(self, text):
+		self.buffer.append(text)
+
+	def flush(self, plantnr=None):
+		""" Write the buffer, as the cmds of plantnr if given """
+		if len(self.buffer) > 0:
+			text = "".join(self.buffer)
+			self.buffer = []
+			if not self.comments:
+				text = strip_comments(text)
+			self.sink.write(text)
+			if plantnr is not None:
+				self.index.append((plantnr, self.offset, text.count("\n")))
+			self.offset += len(text.encode())
+
+	def append_file(self, filename):
+		"""
+		Append a cmds fragment file, and its index, then remove both
+		"""
+		self.flush()
+		with open(filename) as file:
+			shutil.copyfileobj(file, self.sink)
+		for plantnr, offset, lines in read_index(filename + ".idx"):
+			self.index.append((plantnr, self.offset + offset, lines))
+		self.offset += os.path.getsize(filename)
+		os.remove(filename)
+		os.remove(filename + ".idx")
+
+	def getvalue(self):
+		""" The flushed text of a memory sink """
+		self.flush()
+		return self.sink.getvalue()
+
+	def close(self):
+		self.flush()
+		# Keep a memory sink open, to allow getvalue() after the run
+		if not isinstance(self.sink, io.StringIO):
+			self.sink.close()
+		if self.index_filename:
+			with open(self.index_filename, "w") as file:
+				if self.seed is not None:
+					file.write(f"# plant_seed: {self.seed}\n")
+				for plantnr, offset, lines in self.index:
+					file.write(f"{plantnr} {offset} {lines}\n")
+
+class CmdbWriter:
+	"""
+	Writer of the structured (opcode, args) cmds of each plant to a 
+	binary cmdb file
+	"""
+	def __init__(self, filename):
+		self.filename = filename
+		self.file = open(filename, "wb")
+		self.file.write(CMDB_MAGIC)
+		self.index = []
+
+	def write_plant(self, plantnr, cmds):
+		records = np.zeros(len(cmds), dtype=CMDB_RECORD)
+		if len(cmds) > 0:
+			records['op'] = [op for op, args in cmds]
+			records['args'] = [args + (0.0,)*(4 - len(args)) for op, args in cmds]
+		self.write_records(plantnr, records)
+
+	def write_records(self, plantnr, records):
+		self.index.append((plantnr, self.file.tell(), len(records)))
+		self.file.write(records.tobytes())
+
+	def close(self, objects):
+		""" Write the object names and plant index and close the file """
+		offset = self.file.tell()
+		names = "\n".join(objects).encode()
+		self.file.write(struct.pack("<I", len(names)) + names)
+		index = np.array(self.index, dtype=CMDB_INDEX)
+		self.file.write(struct.pack("<I", len(index)) + index.tobytes())
+		self.file.write(struct.pack("<Q", offset) + CMDB_MAGIC)
+		self.file.close()
+
+class CmdbReader:
+	"""
+	Reader of a cmdb file, as (plantnr, records) per plant, where records
+	is a memory-mapped CMDB_RECORD array, with fields 'op' and 'args'
+	"""
+	def __init__(self, filename):
+		with open(filename, "rb") as file:
+			if file.read(len(CMDB_MAGIC)) != CMDB_MAGIC:
+				raise ValueError(f"Not a cmdb file: {filename}")
+			file.seek(-8 - len(CMDB_MAGIC), os.SEEK_END)
+			trailer = file.read()
+			if trailer[8:] != CMDB_MAGIC:
+				raise ValueError(f"Incomplete cmdb file: {filename}")
+			offset, = struct.unpack("<Q", trailer[0:8])
+			file.seek(offset)
+			n, = struct.unpack("<I", file.read(4))
+			names = file.read(n).decode()
+			self.objects = names.split("\n") if n > 0 else []
+			n, = struct.unpack("<I", file.read(4))
+			self.index = np.frombuffer(file.read(n*CMDB_INDEX.itemsize),
+										dtype=CMDB_INDEX)
+		nrecords = (offset - len(CMDB_MAGIC)) // CMDB_RECORD.itemsize
+		if nrecords > 0:
+			self.records = np.memmap(filename, dtype=CMDB_RECORD, mode="r",
+									offset=len(CMDB_MAGIC), shape=(nrecords,))
+		else:
+			self.records = np.zeros(0, dtype=CMDB_RECORD)
+
+	def __len__(self):
+		return len(self.index)
+
+	def plant(self, i):
+		""" The (plantnr, records) of the i'th plant in the file """
+		plantnr, offset, count = self.index[i]
+		start = (int(offset) - len(CMDB_MAGIC)) // CMDB_RECORD.itemsize
+		return int(plantnr), self.records[start:start + int(count)]
+
+	def __iter__(self):
+		for i in range(len(self.index)):
+			yield self.plant(i)
+
+	def close(self):
+		self.records = None
@@ -0,0 +1,231 @@
+#
+# L_NAP_DATASET.py
+# ----------------
+# Function: Streaming writer and lazy reader of a consolidated dataset
+# file, in Detectron2 format, of the image dicts created by L_NAPD.
+#
+# Instead of one indent=4 json file per view, the whole dataset is a
+# single json list[dict], optionally split into shards of at most
+# shard images each, written incrementally as views are annotated:
+#
+#   [
+#   {"image_id":1,"file_name":"Wheat_0001_131_001.jpg",...},
+#   {"image_id":2,"file_name":"Wheat_0001_131_002.jpg",...}
+#   ]
+#
+# Each image dict is on a line of its own, so that iter_dataset can
+# parse one image at a time, without loading the whole dataset.
+#
+# Shards are named <base>_0001<ext>, <base>_0002<ext>, ... from the
+# dataset filename <base><ext>. Files are written as <file>.tmp and
+# only replace any previous dataset files on close().
+#
+# OrderedDatasetWriter writes the views in image_id order, whatever
+# order they are annotated in, holding each view until the views
+# before it are written. Views not annotated again are carried over
+# from the previous dataset, read as far as needed, or from elsewhere.
+#
+# load_json reads the json file of one view, as META files for L_NAPE,
+# parsed by orjson if installed, or the json module, and cached by path,
+# mtime and size, so unchanged files are parsed only once. A file of
+# a Python dict literal, as some hand-made files, is read safely by
+# ast.literal_eval rather than eval. The cached data is shared, so it
+# must not be changed by the caller.
+#
+import os		# File renames and removes
+import glob		# Find shard files
+import json		# Dataset file format
+import ast		# Python literal view files
+import functools	# Cache of view files
+try:
+	import orjson	# Optional faster json parser
+except ImportError:
+	orjson = None
+
+# The most view json files kept parsed by load_json
+JSON_CACHE = 1024
+
+def loads(data):
+	"""
+	Return the parsed json str or bytes data, by orjson if installed
+	"""
+	if orjson is not None:
+		return orjson.loads(data)
+	return json.loads(data)
+
+class DatasetWriter:
+	"""
+	A writer of image dicts to a consolidated dataset json file, or
+	shards of at most shard images when shard > 0
+	"""
+	def __init__(self, filename, shard=0, indent=None):
+		self.filename = filename
+		self.shard = shard
+		self.indent = indent		# None means compact
+		self.file = None
+		self.filenames = []			# Of the written files
+		self.count = 0				# Of the images in the current file
+
+	def shard_filename(self, k):
+		if self.shard <= 0:
+			return self.filename
+		base, ext = os.path.splitext(self.filename)
+		return f"{base}_{k:04}{ext}"
+
+	def write(self, data):
+		""" Append the image dict data, if not empty """
+		if len(data) == 0:
+			return
+		if self.file is not None and self.shard > 0 and self.count >= self.shard:
+			self.close_file()
+		if self.file is None:
+			filename = self.shard_filename(len(self.filenames) + 1)
+			self.filenames.append(filename)
+			self.file = open(filename + ".tmp", "w")
+			self.file.write("[\n")
+			self.count = 0
+		elif self.count > 0:
+			self.file.write(",\n")
+		if self.indent is None:
+			self.file.write(json.dumps(data, separators=(",", ":")))
+		else:
+			self.file.write(json.dumps(data, indent=self.indent))
+		self.count += 1
+
+	def close_file(self):
+		self.file.write("\n]\n")
+		self.file.close()
+		self.file = None
+
+	def close(self):
+		"""
+		Finish the written files, replace the previous dataset files
+		by them, and return their filenames
+		"""
+		if self.file is not None:
+			self.close_file()
+		old_filenames = dataset_files(self.filename)
+		for filename in self.filenames:
+			os.replace(filename + ".tmp", filename)
+		for filename in old_filenames:
+			if filename not in self.filenames:
+				os.remove(filename)
+		return self.filenames
+
+class OrderedDatasetWriter:
+	"""
+	A writer of the image dicts of views, of (image_id, file_name) in 
+	image_id order, to a dataset as DatasetWriter, in that order. The
+	awaited views are put as they are annotated; the carried views are
+	taken from the previous dataset, or else from carry(file_name)
+	"""
+	def __init__(self, filename, shard, views, awaited, carried, carry=None):
+		self.views = views
+		self.awaited = set(awaited)
+		self.carried = set(carried)
+		self.carry = carry
+		self.previous = iter_dataset(filename)	# Read as far as needed
+		self.read_ahead = {}	# Carried views of the previous dataset
+		self.ready = {}			# Put views waiting for previous views
+		self.next_view = 0		# Of views, to write next
+		self.writer = DatasetWriter(filename, shard)
+		self.write_ready()
+
+	def put(self, file_name, data):
+		""" Put the image dict data of an awaited view """
+		self.ready[file_name] = data
+		self.write_ready()
+
+	def carried_data(self, image_id, file_name):
+		while file_name not in self.read_ahead and self.previous is not None:
+			data = next(self.previous, None)
+			if data is None:
+				self.previous = None
+			elif data['file_name'] in self.carried:
+				self.read_ahead[data['file_name']] = data
+		data = self.read_ahead.pop(file_name, None)
+		if data is None and self.carry is not None:
+			data = self.carry(file_name)
+		if data is None:
+			return {}
+		if len(data) > 0:
+			data['image_id'] = image_id
+		return data
+
+	def write_ready(self):
+		while self.next_view < len(self.views):
+			image_id, file_name = self.views[self.next_view]
+			if file_name in self.awaited:
+				if file_name not in self.ready:
+					break
+				self.writer.write(self.ready.pop(file_name))
+			elif file_name in self.carried:
+				self.writer.write(self.carried_data(image_id, file_name))
+			self.next_view += 1
+
+	def close(self):
+		"""
+		Finish the dataset, of the views written so far, and return its
+		filenames
+		"""
+		self.previous = None
+		return self.writer.close()
+
+def dataset_files(filename):
+	"""
+	Return the existing file of the dataset filename, or its sorted
+	shard files
+	"""
+	if os.path.exists(filename):
+		return [filename]
+	base, ext = os.path.splitext(filename)
+	return sorted(glob.glob(f"{glob.escape(base)}_[0-9][0-9][0-9][0-9]{ext}"))
+
+def iter_dataset(filename):
+	"""
+	Yield the image dicts of the dataset filename, or its shards, one
+	at a time; a file not written a line per image is loaded whole
+	"""
+	for path in dataset_files(filename):
+		with open(path) as file:
+			first, second = file.readline().strip(), file.readline().strip()
+			if first != "[" or not second.rstrip(",").endswith("}"):
+				# Not a line per image, as when written with indent
+				file.seek(0)
+				yield from json.load(file)
+				continue
+			yield loads(second.rstrip(","))
+			for line in file:
+				line = line.strip().rstrip(",")
+				if line in ("", "]"):
+					continue
+				yield loads(line)
+
+def load_dataset(filename):
+	"""
+	Return the list of all image dicts of the dataset filename
+	"""
+	return list(iter_dataset(filename))
+
+@functools.lru_cache(maxsize=JSON_CACHE)
+def cached_json(path, mtime_ns, size):
+	"""
+	Return the parsed data of the json file at path, of the given mtime
+	and size, or None if the file is empty
+	"""
+	with open(path, "rb") as file:
+		data = file.read()
+	if len(data.strip()) == 0:
+		return None
+	try:
+		return loads(data)
+	except ValueError:
+		return ast.literal_eval(data.decode())
+
+def load_json(path):
+	"""
+	Return the parsed data of the json file at path, or None if it is
+	empty, parsing it again only if its mtime or size has changed
+	"""
+	stat = os.stat(path)
+	return cached_json(path, stat.st_mtime_ns, stat.st_size)
@@ -0,0 +1,200 @@
+#
+# L_NAP_METRICS.py
+# ----------------
+# Function: Detection quality metrics of the boxes found by L_NAPE in
+# the real (GWCD) images, against their ground truth boxes: precision,
+# recall and average precision (AP) at several IoU thresholds.
+#
+# Boxes are (x1, y1, x2, y2) in pixels of the real image. Ground truth
+# is read by load_truth from either:
+#
+#   a csv file, as of the Global Wheat Head Dataset, of the columns
+#   image_name and BoxesString, "x1 y1 x2 y2;x1 y1 x2 y2;...", or
+#   "no_box" for an image without wheat heads, or
+#
+#   a json file of a dict of image name to a list of boxes
+#
+# where image names are matched without their extension.
+#
+# In each image, detections in descending score order are matched to
+# the unmatched ground truth box of highest IoU, if at least the IoU
+# threshold, as true positives, and otherwise are false positives,
+# for all IoU thresholds at once. AP is the area under the precision
+# envelope of the precision/recall curve of the detections of all the
+# images in descending score order, and mAP is its mean over the IoU
+# thresholds.
+#
+# Run as a script to benchmark evaluate_detections on random images.
+#
+import sys
+import csv		# Ground truth csv files
+import json		# Ground truth and report files
+import os
+import time
+import numpy as np
+
+from L_NAP_NMS import iou_matrix
+from L_NAP_DATASET import load_json
+
+# IoU thresholds of the report, from 0.5 to 0.95, as COCO
+IOU_THRESHOLDS = [round(0.5 + 0.05*i, 2) for i in range(10)]
+
+def parse_boxes(boxes_string):
+	"""
+	Return the (K, 4) float array of the boxes of a BoxesString
+	"""
+	boxes_string = boxes_string.strip()
+	if boxes_string in ("", "no_box"):
+		return np.zeros((0, 4))
+	return np.array([[float(v) for v in box.split()]
+					 for box in boxes_string.split(";")]).reshape(-1, 4)
+
+def load_truth(filename):
+	"""
+	Return the dict of image name, without extension, to the (K, 4)
+	float array of its ground truth boxes, from the csv or json filename
+	"""
+	truth = {}
+	if filename.endswith(".json"):
+		for name, boxes in load_json(filename).items():
+			truth[os.path.splitext(name)[0]] = \
+						np.asarray(boxes, dtype=float).reshape(-1, 4)
+		return truth
+	with open(filename, newline="") as file:
+		for row in csv.DictReader(file):
+			name = os.path.splitext(row['image_name'])[0]
+			boxes = parse_boxes(row['BoxesString'])
+			if name in truth:
+				boxes = np.concatenate([truth[name], boxes])
+			truth[name] = boxes
+	return truth
+
+def match_image(boxes, scores, truth, iou_thresholds=IOU_THRESHOLDS):
+	"""
+	Return the scores of the detection boxes of an image in descending
+	order, and the (T, D) bool matrix of which of them are true positives
+	at each of the T iou_thresholds
+	"""
+	boxes = np.asarray(boxes, dtype=float).reshape(-1, 4)
+	scores = np.asarray(scores, dtype=float)
+	thresholds = np.asarray(iou_thresholds, dtype=float)
+	order = np.argsort(-scores, kind='stable')
+	tp = np.zeros((len(thresholds), len(boxes)), dtype=bool)
+	if len(boxes) == 0 or len(truth) == 0:
+		return scores[order], tp
+	iou = iou_matrix(boxes[order], truth)
+	taken = np.zeros((len(thresholds), len(truth)), dtype=bool)
+	rows = np.arange(len(thresholds))
+	for d in np.flatnonzero(iou.max(axis=1) >= thresholds.min()):
+		# The best untaken truth box at each threshold at once
+		candidates = np.where((iou[d] >= thresholds[:, None]) & ~taken, iou[d], -1.0)
+		best = candidates.argmax(axis=1)
+		hit = candidates[rows, best] >= 0
+		tp[hit, d] = True
+		taken[rows[hit], best[hit]] = True
+	return scores[order], tp
+
+def average_precision(tp, scores, truths):
+	"""
+	Return the AP, from the true positive flags tp of detections of the
+	given scores, in descending score order, of all truths boxes
+	"""
+	if truths == 0 or len(tp) == 0:
+		return 0.0
+	tp = tp[np.argsort(-scores, kind='stable')]
+	tps = np.cumsum(tp)
+	recall = tps / truths
+	precision = tps / np.arange(1, len(tp) + 1)
+	# The precision envelope, at each recall step
+	recall = np.concatenate([[0.0], recall, [1.0]])
+	precision = np.concatenate([[0.0], precision, [0.0]])
+	precision = np.maximum.accumulate(precision[::-1])[::-1]
+	i = np.flatnonzero(recall[1:] != recall[:-1])
+	return float(np.sum((recall[i+1] - recall[i]) * precision[i+1]))
+
+def evaluate_detections(detections, truth, iou_thresholds=IOU_THRESHOLDS):
+	"""
+	Return the report dict of the metrics of detections, a dict of image
+	name to its list of detection dicts of 'bbox' and 'score', against
+	the truth boxes of each image, of those images in both
+	"""
+	names = [name for name in detections if name in truth]
+	scores, tps, per_image = [], [], []
+	truths = 0
+	for name in names:
+		boxes = [d['bbox'] for d in detections[name]]
+		image_scores, tp = match_image(boxes, [d['score'] for d in detections[name]],
+									   truth[name], iou_thresholds)
+		scores.append(image_scores)
+		tps.append(tp)
+		truths += len(truth[name])
+		per_image.append({
+			'real_file':  name,
+			'truths':     len(truth[name]),
+			'detections': len(boxes),
+			'tp':         int(tp[0].sum()) if len(iou_thresholds) > 0 else 0
+			})
+	scores = np.concatenate(scores) if scores else np.zeros(0)
+	tps = np.concatenate(tps, axis=1) if tps else \
+			np.zeros((len(iou_thresholds), 0), dtype=bool)
+
+	thresholds = []
+	for t, iou in enumerate(iou_thresholds):
+		tp = int(tps[t].sum())
+		thresholds.append({
+			'iou':       iou,
+			'AP':        round(average_precision(tps[t], scores, truths), 4),
+			'precision': round(tp / len(scores), 4) if len(scores) > 0 else 0.0,
+			'recall':    round(tp / truths, 4) if truths > 0 else 0.0,
+			'tp':        tp,
+			'fp':        len(scores) - tp,
+			'fn':        truths - tp
+			})
+	return {
+		'images':         len(names),
+		'unannotated':    sorted(name for name in detections if name not in truth),
+		'truths':         truths,
+		'detections':     len(scores),
+		'mAP':            round(float(np.mean([t['AP'] for t in thresholds])), 4)
+							if thresholds else 0.0,
+		'iou_thresholds': thresholds,
+		'per_image':      per_image
+		}
+
+def write_report(report, filename):
+	"""
+	Write the report dict to the json filename
+	"""
+	with open(filename, "w") as file:
+		json.dump(report, file, indent=4)
+
+def main():
+	"""
+	Benchmark evaluate_detections on random images of wheat head boxes,
+	detected with random shifts, misses and false detections
+	"""
+	rng = np.random.default_rng(0)
+	truth, detections = {}, {}
+	for k in range(5000):
+		xy = rng.integers(0, 1000, (40, 2))
+		wh = rng.integers(30, 90, (40, 2))
+		boxes = np.concatenate([xy, xy + wh], axis=1).astype(float)
+		name = f"tr_{k:05}"
+		truth[name] = boxes
+		found = boxes[rng.random(len(boxes)) < 0.8] + rng.normal(0, 5, (1, 4))
+		false = boxes[0:10] + rng.integers(40, 200, (10, 1))
+		detections[name] = [{'bbox': box.tolist(), 'score': int(rng.integers(50, 100))}
+							for box in np.concatenate([found, false])]
+	t = time.perf_counter()
+	report = evaluate_detections(detections, truth)
+	seconds = time.perf_counter() - t
+	print(f"{report['images']} images, {report['truths']} truths, "
+		  f"{report['detections']} detections: {seconds:0.3f}s, "
+		  f"mAP {report['mAP']}")
+	for t in report['iou_thresholds'][0::3]:
+		print(f"  IoU {t['iou']}: AP {t['AP']}, precision {t['precision']}, "
+			  f"recall {t['recall']}")
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,89 @@
+#
+# L_NAP_NMS.py
+# ------------
+# Function: Non-maximum suppression (NMS) of overlapping boxes, for the
+# local maxima found by L_NAPE, and the IoU of boxes, by NumPy.
+#
+# Boxes are an (N, 4) array of (x1, y1, x2, y2), with an (N,) array of
+# scores and of areas. Boxes are ranked by the case of L_NAPE:
+#
+#   case 1 - larger area first
+#   case 2 - higher score first
+#   case 3 - higher sqrt(area) * score first
+#
+# with ties ranked by their order in boxes, and then each box in rank
+# order, if not yet suppressed, suppresses every lower ranked box whose
+# IoU with it is more than allowed_IoU.
+#
+import numpy as np
+
+CASES = [1, 2, 3]
+
+def box_areas(boxes):
+	"""
+	Return the (N,) areas of the (N, 4) boxes
+	"""
+	boxes = np.asarray(boxes, dtype=float).reshape(-1, 4)
+	return (boxes[:, 2] - boxes[:, 0]).clip(0) * (boxes[:, 3] - boxes[:, 1]).clip(0)
+
+def iou_matrix(boxes1, boxes2, areas1=None, areas2=None):
+	"""
+	Return the (N1, N2) matrix of the intersection over union of each
+	of boxes1 with each of boxes2, where union is the sum of the areas
+	less the intersection
+	"""
+	boxes1 = np.asarray(boxes1, dtype=float).reshape(-1, 4)
+	boxes2 = np.asarray(boxes2, dtype=float).reshape(-1, 4)
+	if areas1 is None:
+		areas1 = box_areas(boxes1)
+	if areas2 is None:
+		areas2 = box_areas(boxes2)
+	x1 = np.maximum(boxes1[:, None, 0], boxes2[None, :, 0])
+	y1 = np.maximum(boxes1[:, None, 1], boxes2[None, :, 1])
+	x2 = np.minimum(boxes1[:, None, 2], boxes2[None, :, 2])
+	y2 = np.minimum(boxes1[:, None, 3], boxes2[None, :, 3])
+	inter = (x2 - x1).clip(0) * (y2 - y1).clip(0)
+	union = np.asarray(areas1, dtype=float)[:, None] + \
+			np.asarray(areas2, dtype=float)[None, :] - inter
+	iou = np.zeros(inter.shape)
+	np.divide(inter, union, out=iou, where=union > 0)
+	return iou
+
+def rank(scores, areas, case=1):
+	"""
+	Return the indexes of the boxes of scores and areas in rank order
+	for the given case
+	"""
+	scores = np.asarray(scores, dtype=float)
+	areas = np.asarray(areas, dtype=float)
+	if case == 1:
+		priority = areas
+	elif case == 2:
+		priority = scores
+	elif case == 3:
+		priority = np.sqrt(areas) * scores
+	else:
+		raise ValueError(f"Unknown NMS case: {case}, not one of {CASES}")
+	return np.argsort(-priority, kind='stable')
+
+def nms(boxes, scores, areas=None, case=1, allowed_IoU=0.2):
+	"""
+	Return the indexes of the boxes kept after suppressing those which
+	overlap a higher ranked kept box by more than allowed_IoU, in rank
+	order
+	"""
+	boxes = np.asarray(boxes, dtype=float).reshape(-1, 4)
+	if areas is None:
+		areas = box_areas(boxes)
+	areas = np.asarray(areas, dtype=float)
+	order = rank(scores, areas, case)
+	keep = []
+	while len(order) > 0:
+		best = order[0]
+		keep.append(best)
+		order = order[1:]
+		if len(order) == 0:
+			break
+		iou = iou_matrix(boxes[best], boxes[order], areas[best:best+1], areas[order])[0]
+		order = order[iou <= allowed_IoU]
+	return np.array(keep, dtype=np.int64)
@@ -0,0 +1,152 @@
+#
+# L_NAP_RLE.py
+# ------------
+# Function: Run length encoding (RLE) of segmentation masks, shared by
+# L_NAPD, which encodes the mask of each view, and L_NAPE, which
+# decodes them again.
+#
+# Two kinds of RLE counts are supported:
+#
+#   runs - The L_NAPD counts, of (start, length) pairs of each run of
+#          mask pixels, in the row-major flattened mask. For example
+#          [322,66, 1286,64, 2243,62, ...] is three runs of
+#          (flat-start, length) of (322,66), (1286,64), (2243,62).
+#
+#          NOTE: A run from one y-row which continues onto the next
+#          y-row is a single run, so a run may overrun the end of its
+#          row, which must be allowed for when drawing runs by row.
+#
+#   coco - The COCO counts, of the alternating lengths of the runs of
+#          0 and 1 pixels, starting with 0 pixels, in the column-major
+#          flattened mask, either uncompressed as a list of ints, or
+#          compressed to a string, as by pycocotools.
+#
+# Encoding and decoding are vectorized by NumPy (the compressed COCO
+# string itself is a short loop per count).
+#
+import numpy as np
+
+RLE_FORMATS = ["runs", "coco"]
+
+def runs_encode(mask):
+	"""
+	Return the list of (start, length) run pairs of the non-zero pixels
+	of mask, in the row-major flattened mask
+	"""
+	flat = np.concatenate([[0], (np.asarray(mask).reshape(-1) != 0), [0]])
+	runs = np.flatnonzero(flat[1:] != flat[:-1])
+	runs[1::2] -= runs[::2]
+	return runs.tolist()
+
+def runs_decode(counts, height, width, out=None):
+	"""
+	Return the (height, width) uint8 mask of the (start, length) run
+	pairs counts, written into out if given
+	"""
+	if out is None:
+		out = np.zeros((height, width), dtype=np.uint8)
+	flat = out.reshape(-1)
+	counts = np.asarray(counts, dtype=np.int64)
+	if len(counts) == 0:
+		flat[:] = 0
+		return out
+	starts = counts[0::2]
+	ends = np.minimum(starts + counts[1::2], flat.size)
+	# +1 at each run start and -1 at each run end, summed to the mask
+	edges = np.zeros(flat.size + 1, dtype=np.int32)
+	np.add.at(edges, starts, 1)
+	np.add.at(edges, ends, -1)
+	flat[:] = np.cumsum(edges[:-1]) > 0
+	return out
+
+def coco_encode(mask):
+	"""
+	Return the uncompressed COCO counts of mask, as a list of ints
+	"""
+	flat = (np.asarray(mask) != 0).T.reshape(-1)
+	changes = np.flatnonzero(flat[1:] != flat[:-1]) + 1
+	counts = np.diff(np.concatenate([[0], changes, [flat.size]]))
+	if flat.size > 0 and flat[0]:
+		counts = np.concatenate([[0], counts])
+	return counts.tolist()
+
+def coco_decode(counts, height, width, out=None):
+	"""
+	Return the (height, width) uint8 mask of the uncompressed COCO
+	counts, written into out if given
+	"""
+	if out is None:
+		out = np.zeros((height, width), dtype=np.uint8)
+	counts = np.asarray(counts, dtype=np.int64)
+	values = np.arange(len(counts), dtype=np.uint8) & 1
+	out[:] = np.repeat(values, counts).reshape(width, height).T
+	return out
+
+def coco_compress(counts):
+	"""
+	Return the compressed COCO string of the uncompressed COCO counts
+	"""
+	chars = []
+	for i, x in enumerate(counts):
+		x = int(x)
+		if i > 2:
+			x -= int(counts[i-2])
+		more = True
+		while more:
+			c = x & 0x1f
+			x >>= 5
+			more = x != -1 if c & 0x10 else x != 0
+			if more:
+				c |= 0x20
+			chars.append(chr(c + 48))
+	return "".join(chars)
+
+def coco_decompress(string):
+	"""
+	Return the uncompressed COCO counts of the compressed COCO string
+	"""
+	counts = []
+	p = 0
+	while p < len(string):
+		x = 0
+		k = 0
+		more = True
+		while more:
+			c = ord(string[p]) - 48
+			x |= (c & 0x1f) << 5*k
+			more = c & 0x20
+			p += 1
+			k += 1
+			if not more and c & 0x10:
+				x |= -1 << 5*k
+		if len(counts) > 2:
+			x += counts[-2]
+		counts.append(x)
+	return counts
+
+def encode(mask, rle_format="runs"):
+	"""
+	Return the segmentation dict {'size', 'counts'} of mask, with runs
+	counts, or compressed COCO counts
+	"""
+	height, width = np.shape(mask)[0:2]
+	if rle_format == "runs":
+		counts = runs_encode(mask)
+	elif rle_format == "coco":
+		counts = coco_compress(coco_encode(mask))
+	else:
+		raise ValueError(f"Unknown RLE format: {rle_format}, not one of {RLE_FORMATS}")
+	return {'size': [height, width], 'counts': counts}
+
+def decode(segmentation, out=None):
+	"""
+	Return the uint8 mask of the segmentation dict {'size', 'counts'},
+	where compressed COCO counts are a string, and runs counts a list
+	"""
+	height, width = segmentation['size']
+	counts = segmentation['counts']
+	if isinstance(counts, (str, bytes)):
+		if isinstance(counts, bytes):
+			counts = counts.decode()
+		return coco_decode(coco_decompress(counts), height, width, out)
+	return runs_decode(counts, height, width, out)
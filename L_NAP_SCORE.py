@@ -0,0 +1,311 @@
+#
+# L_NAP_SCORE.py
+# --------------
+# Function: Score a synthetic template (synt) image against every
+# sliding window position of a real (GWCD) image, for L_NAPE.
+#
+# The score of a window at (x, y), on a grid of step pixels, is the
+# clipped sum over the window of:  max(real/2 + synt - 128, 0)
+# where windows beyond the right or bottom edge of real are zero
+# filled (and then real/2 is truncated to an integer).
+#
+# Scores of at least min_score are recorded in an iscore matrix as the
+# integer percentage of maximus (iscore is uint8, so a percentage
+# above 255 wraps around).
+#
+# score_map computes the iscore of the original loop over every window
+# (kept as the reference of the tests) from strided views of all
+# windows of a block of grid rows at a time, in uint8 for the templates
+# of L_NAPE.
+#
+# local_maxima finds the peaks of iscore, as candidate boxes on real,
+# in a MAXIMA structured array, whose records are used as the tuples
+# (x1, y1, x2, y2, score, name, area, ms) of the original L_NAPE, where
+# ms is the index of the synt image.
+#
+# pyramid_map is a coarse to fine search: scoring a downsampled real
+# and synt first, and then in full only the cells around the coarse
+# peaks, and their neighbours, so that the local maxima of those cells
+# (the returned refined mask) are the same as of a full search, and
+# scale_template resizes synt to search for it at other scales.
+#
+# ncc_map is the alternative metric of the normalized cross-correlation
+# (the Pearson correlation, from -1 to 1) of synt with each window of
+# real, by OpenCV matchTemplate (TM_CCOEFF_NORMED), which correlates by
+# DFT for larger templates and normalizes by integral images, so it 
+# scores every pixel offset at once. It only scores windows wholly 
+# inside real, and records correlations of at least min_score in iscore
+# as integer percentages.
+#
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+import cv2		# Resize real and synt images for pyramid_map
+
+# The most window pixels scored at once by score_map
+CHUNK = 1 << 22
+
+# The window score metrics of L_NAPE: clipped sum or ncc
+METRICS = ["clipped", "ncc"]
+
+MAXIMA = np.dtype([('x1', np.int32), ('y1', np.int32), 
+				   ('x2', np.int32), ('y2', np.int32), 
+				   ('score', np.uint8), ('name', 'U32'), 
+				   ('area', np.int64), ('ms', np.int32)])
+
+def window_sums(padded, synt, xs, ys, chunk=CHUNK):
+	"""
+	Return the clipped sums of synt at the windows of padded at rows xs
+	and columns ys, both ranges of equal step: of max(padded, synt) - synt
+	when both are uint8, and otherwise of max(padded + synt - 128, 0)
+	"""
+	sx_max, sy_max = synt.shape
+	box_area = sx_max * sy_max
+	integer = padded.dtype == np.uint8
+	sums = np.zeros((len(xs), len(ys)), dtype=np.int64 if integer else float)
+	if len(xs) == 0 or len(ys) == 0:
+		return sums
+	step = xs[1] - xs[0] if len(xs) > 1 else 1
+	y_step = ys[1] - ys[0] if len(ys) > 1 else 1
+	windows = sliding_window_view(padded, (sx_max, sy_max))
+	windows = windows[:, ys[0]:ys[-1]+1:y_step]
+	rows = max(1, chunk // (len(ys) * box_area))
+	for i in range(0, len(xs), rows):
+		block = windows[xs[i]:xs[min(i+rows, len(xs))-1]+1:step]
+		if integer:
+			clipped = np.maximum(block, synt)
+			clipped -= synt
+			sums[i:i+len(block)] = clipped.sum(axis=(2, 3), dtype=np.int64)
+		else:
+			clipped = ((block + synt) - 128).clip(0, None)
+			clipped = clipped.reshape(len(block), len(ys), box_area)
+			sums[i:i+len(block)] = np.mean(clipped, axis=2) * box_area
+	return sums
+
+def score_levels(real, synt):
+	"""
+	Return (synt, real_half, real_floor, integer) to score synt on real,
+	in uint8 as the levels 256 - 2*synt and 2*real/2 and 2*(real//2),
+	when integer, or otherwise as synt, real/2 and real//2 in float
+	"""
+	level = 256 - synt * 2
+	integer = real.dtype == np.uint8 and \
+				np.array_equal(level, np.round(level)) and \
+				level.min() >= 0 and level.max() <= 255
+	if integer:
+		return level.astype(np.uint8), real, real & 0xfe, True
+	return synt, real/2, real//2, False
+
+def score_grid(real, synt, step, chunk=CHUNK):
+	"""
+	Return the float scores, as np.mean(clipped) * box_area, of synt at
+	each window of real on the step grid
+	"""
+	rx_max, ry_max = real.shape
+	sx_max, sy_max = synt.shape
+	box_area = sx_max * sy_max
+	xs = np.arange(0, rx_max-step, step)
+	ys = np.arange(0, ry_max-step, step)
+	synt, real_half, real_floor, integer = score_levels(real, synt)
+
+	# Windows inside real use real/2, and windows over the edge the
+	# truncated real//2, of real zero filled beyond the edges
+	padded = np.zeros((rx_max + sx_max, ry_max + sy_max), dtype=real_half.dtype)
+	padded[0:rx_max, 0:ry_max] = real_half
+	sums = window_sums(padded, synt, xs, ys, chunk)
+
+	x_edge = np.searchsorted(xs, rx_max - sx_max, side='right')
+	y_edge = np.searchsorted(ys, ry_max - sy_max, side='right')
+	if x_edge < len(xs) or y_edge < len(ys):
+		padded[0:rx_max, 0:ry_max] = real_floor
+		sums[x_edge:] = window_sums(padded, synt, xs[x_edge:], ys, chunk)
+		sums[0:x_edge, y_edge:] = window_sums(padded, synt,
+									xs[0:x_edge], ys[y_edge:], chunk)
+
+	# As np.mean(clipped) * box_area, from the whole sums of the doubled
+	# clipped values, as float sums half values exactly
+	if integer:
+		return sums / 2 / box_area * box_area
+	return sums
+
+def cell_scores(real, synt, step, ns, ms, chunk=CHUNK):
+	"""
+	Return the float scores, as score_grid, of synt at only the windows
+	of the step grid cells (ns, ms)
+	"""
+	rx_max, ry_max = real.shape
+	sx_max, sy_max = synt.shape
+	box_area = sx_max * sy_max
+	xs, ys = np.asarray(ns) * step, np.asarray(ms) * step
+	synt, real_half, real_floor, integer = score_levels(real, synt)
+	edge = (xs + sx_max > rx_max) | (ys + sy_max > ry_max)
+
+	sums = np.zeros(len(xs), dtype=np.int64 if integer else float)
+	padded = np.zeros((rx_max + sx_max, ry_max + sy_max), dtype=real_half.dtype)
+	cells = max(1, chunk // box_area)
+	for real_x, on_edge in ((real_half, False), (real_floor, True)):
+		padded[0:rx_max, 0:ry_max] = real_x
+		windows = sliding_window_view(padded, (sx_max, sy_max))
+		todo = np.flatnonzero(edge == on_edge)
+		for i in range(0, len(todo), cells):
+			k = todo[i:i+cells]
+			block = windows[xs[k], ys[k]]
+			if integer:
+				clipped = np.maximum(block, synt)
+				clipped -= synt
+				sums[k] = clipped.sum(axis=(1, 2), dtype=np.int64)
+			else:
+				clipped = ((block + synt) - 128).clip(0, None)
+				sums[k] = np.mean(clipped.reshape(len(k), box_area), axis=1) * box_area
+	if integer:
+		return sums / 2 / box_area * box_area
+	return sums
+
+def iscore_of(scores, min_score, maximus, shape, cells=None):
+	"""
+	Return the (N, M) uint8 iscore matrix of the scores of the whole
+	grid, or of the given (ns, ms) cells of it
+	"""
+	iscore = np.zeros(shape, dtype=np.uint8)
+	found = scores >= min_score
+	percent = (scores[found]/maximus*100).astype(np.int64)
+	if cells is None:
+		iscore[0:scores.shape[0], 0:scores.shape[1]][found] = \
+										(percent & 0xff).astype(np.uint8)
+	else:
+		ns, ms = cells
+		iscore[ns[found], ms[found]] = (percent & 0xff).astype(np.uint8)
+	return iscore
+
+def score_map(real, synt, step, min_score, maximus, shape, chunk=CHUNK):
+	"""
+	Return the (N, M) uint8 iscore matrix of synt on real, the same as
+	the original loop over every window, scoring up to chunk window 
+	pixels at once.
+	
+	When 2*synt is a whole number from 1 to 256, as in L_NAPE, the score
+	is computed exactly in uint8 as max(real/2 + synt - 128, 0) * 2 == 
+	max(real, level) - level, where level = 256 - 2*synt, which is 
+	several times faster than in float.
+	"""
+	scores = score_grid(real, synt, step, chunk)
+	return iscore_of(scores, min_score, maximus, shape)
+
+def scale_template(synt, scale):
+	"""
+	Return synt resized by scale, with values rounded to halves, so that
+	a synt of half values stays one
+	"""
+	if scale == 1:
+		return synt
+	sx_max, sy_max = synt.shape
+	size = (max(1, round(sy_max * scale)), max(1, round(sx_max * scale)))
+	interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR
+	scaled = cv2.resize(synt.astype(np.float32), size, interpolation=interpolation)
+	return np.round(scaled.astype(float) * 2) / 2
+
+def pyramid_map(real, synt, step, min_score, maximus, shape, factor=4,
+				ratio=0.8, chunk=CHUNK):
+	"""
+	Return the (N, M) uint8 iscore matrix of synt on real, and the
+	(N, M) bool mask of its refined cells, coarse to fine: scoring real
+	and synt downsampled by factor first, and then scoring in full only
+	the refined grid cells around each coarse local maximum of at least
+	ratio * min_score (as scaled to the coarse area), and the cells next
+	to them, which are only scored to compare the refined cells with.
+	Other cells are 0, so only the local maxima of the refined cells
+	are found as in score_map.
+	"""
+	rx_max, ry_max = real.shape
+	nx, ny = len(range(0, rx_max-step, step)), len(range(0, ry_max-step, step))
+	if factor <= 1 or nx == 0 or ny == 0:
+		return score_map(real, synt, step, min_score, maximus, shape, chunk), \
+				np.ones(shape, dtype=bool)
+
+	real_c = cv2.resize(real, (max(1, ry_max//factor), max(1, rx_max//factor)),
+						interpolation=cv2.INTER_AREA)
+	synt_c = scale_template(synt, 1/factor)
+	area_ratio = synt_c.size / synt.size
+	step_c = max(1, step // factor)
+	scores_c = score_grid(real_c, synt_c, step_c, chunk)
+	if scores_c.size == 0:
+		return np.zeros(shape, dtype=np.uint8), np.zeros(shape, dtype=bool)
+	peaks = local_maxima(iscore_of(scores_c, ratio * min_score * area_ratio,
+						 maximus * area_ratio, scores_c.shape), step_c, (1, 1))
+
+	# The full grid cells within a coarse cell of each peak
+	todo = np.zeros((nx, ny), dtype=bool)
+	radius = -(-(step_c * factor) // step) + 1
+	for y1, x1 in zip(peaks['y1'], peaks['x1']):
+		n, m = y1 * factor // step, x1 * factor // step
+		todo[max(0, n-radius):n+radius+1, max(0, m-radius):m+radius+1] = True
+	# And their neighbours
+	scored = todo.copy()
+	scored[1:] |= todo[:-1]
+	scored[:-1] |= todo[1:]
+	scored[:, 1:] |= scored[:, :-1].copy()
+	scored[:, :-1] |= scored[:, 1:].copy()
+	ns, ms = np.nonzero(scored)
+	scores = cell_scores(real, synt, step, ns, ms, chunk)
+	refined = np.zeros(shape, dtype=bool)
+	refined[0:nx, 0:ny] = todo
+	return iscore_of(scores, min_score, maximus, shape, (ns, ms)), refined
+
+def ncc_scores(real, synt):
+	"""
+	Return the float32 normalized cross-correlation of synt with the 
+	window of real at every pixel offset where synt fits, as an array of
+	(rx_max - sx_max + 1, ry_max - sy_max + 1), zero for a flat synt
+	"""
+	rx_max, ry_max = real.shape
+	sx_max, sy_max = synt.shape
+	shape = (max(0, rx_max - sx_max + 1), max(0, ry_max - sy_max + 1))
+	if shape[0] == 0 or shape[1] == 0 or synt.min() == synt.max():
+		return np.zeros(shape, dtype=np.float32)
+	scores = cv2.matchTemplate(real.astype(np.float32), 
+						synt.astype(np.float32), cv2.TM_CCOEFF_NORMED)
+	return scores.clip(-1, 1)
+
+def ncc_map(real, synt, step, min_score):
+	"""
+	Return the uint8 iscore matrix of the normalized cross-correlation
+	of synt on real, as percentages of at least min_score, at every step
+	pixels (step 1 for every pixel) of the windows inside real
+	"""
+	scores = ncc_scores(real, synt)[::step, ::step]
+	return iscore_of(scores.clip(0, None), min_score, 1.0, scores.shape)
+
+def local_maxima(iscore, step, synt_shape, name="", ms=0, top_k=0, mask=None):
+	"""
+	Return the MAXIMA array of the boxes of the non-zero local maxima of
+	iscore, each not less than its 8 neighbours (so not on the border),
+	and in mask if given, in row order, or only the top_k highest 
+	scoring of them if top_k > 0
+	"""
+	sx_max, sy_max = synt_shape
+	N, M = iscore.shape
+	peak = np.zeros((N, M), dtype=bool)
+	if N > 2 and M > 2:
+		i = iscore[1:N-1, 1:M-1]
+		peak[1:N-1, 1:M-1] = i > 0
+		for dn in (-1, 0, 1):
+			for dm in (-1, 0, 1):
+				if dn != 0 or dm != 0:
+					peak[1:N-1, 1:M-1] &= i >= iscore[1+dn:N-1+dn, 1+dm:M-1+dm]
+	if mask is not None:
+		peak &= mask
+	n, m = np.nonzero(peak)
+	if top_k > 0 and len(n) > top_k:
+		top = np.argsort(-iscore[n, m].astype(int), kind='stable')[0:top_k]
+		top.sort()
+		n, m = n[top], m[top]
+
+	maxima = np.zeros(len(n), dtype=MAXIMA)
+	maxima['x1'] = step*m
+	maxima['y1'] = step*n
+	maxima['x2'] = step*m + sy_max
+	maxima['y2'] = step*n + sx_max
+	maxima['score'] = iscore[n, m]
+	maxima['name'] = name
+	maxima['area'] = sx_max * sy_max
+	maxima['ms'] = ms
+	return maxima
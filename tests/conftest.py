@@ -0,0 +1,22 @@
+#
+# conftest.py
+# -----------
+# Function: Make the L_NAP modules importable by the tests, with the
+# data directories of L_NAP_DIRS (a local file, not in the repository)
+# set to temporary directories.
+#
+import os
+import sys
+import types
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+L_NAP_DIRS = types.ModuleType("L_NAP_DIRS")
+base = tempfile.mkdtemp(prefix="L_NAP_tests_")
+for name in ["VIEW", "RESULT", "TEMP", "META", "GWCD", "MODEL"]:
+	path = os.path.join(base, name.lower())
+	os.makedirs(path)
+	setattr(L_NAP_DIRS, name, path)
+sys.modules["L_NAP_DIRS"] = L_NAP_DIRS
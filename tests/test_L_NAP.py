@@ -0,0 +1,112 @@
+#
+# Tests of growing plants by L_NAP, serially and by parallel workers
+#
+import sys
+import gzip
+import itertools
+import pytest
+
+from L_NAP import *
+from L_NAP_CMDS import read_index, index_seed
+
+# Parameters of a small wheat head run, as L_NAPA_p.py
+PARAMETERS = """
+p = %r
+def Parameters_p(): return p
+def Axiom_p(): return {'rule': 'Axiom'}
+def Stalk_p(): return {'rule': 'Stalk', 'curve': [(5, 0, 1, 0.1), (5, 10, 1, 0.1)]}
+def GrainSpace_p():
+	R = p['Random']
+	return {'rule': 'GrainSpace', 'pitch': R.normal(10, 1), 'turn': 137.5,
+			'roll': R.normal(5, 1), 'draw': (0.2, 0.05)}
+def Grain_p(): return {'rule': 'Grain', 'pitch': -30, 'object': 'Grain',
+					   'scale': (1, 1, 1)}
+def Awn_p(): return {'rule': 'Awn', 'curve': [(p['Random'].normal(2, 1), 0, 0.5, 0.01)]}
+"""
+
+runs = itertools.count(1)
+
+def grow(tmp_path, monkeypatch, plantnr=None, seed=None, name=None, **params):
+	"""
+	Grow the plants of a run of the given parameters in tmp_path, as
+	L_NAPA.py, and return its L_NAP object and the path of its cmds file
+	"""
+	tmp_path.mkdir(parents=True, exist_ok=True)
+	monkeypatch.chdir(tmp_path)
+	monkeypatch.syspath_prepend(str(tmp_path))
+	if name is None:
+		name = f"L_NAPT{next(runs)}"
+	# The parameters module, imported afresh for each run
+	monkeypatch.delitem(sys.modules, f"{name}_p", raising=False)
+	p = {'PlantNr': 0, 'Plants': 6, 'deltas': (('Grain_count', 3, 4, 5),)}
+	p.update(params)
+	(tmp_path / f"{name}_p.py").write_text(PARAMETERS % p)
+	
+	L = L_NAP(f"{name}_p", plantnr=plantnr, seed=seed)
+	
+	@L.rule
+	def Axiom():		L(Stalk, GrainSpace)
+	
+	@L.rule
+	def Stalk():		L(Curve)
+	
+	@L.rule
+	def GrainSpace():	L(Pitch, Turn, Roll, Draw, Grain, GrainSpace)
+	
+	@L.rule
+	def Grain():		L(Save, Pitch, Object, Awn, Restore)
+	
+	@L.rule
+	def Awn():			L(Curve)
+	
+	L.grow_plants(Axiom)
+	return L, str(tmp_path / L.cmds_filename)
+
+def test_parallel_gzip_cmds_same_as_serial(tmp_path, monkeypatch):
+	serial, serial_path = grow(tmp_path / "1", monkeypatch, 
+							   workers=1, seed=7, cmds_sink="gzip")
+	parallel, parallel_path = grow(tmp_path / "3", monkeypatch, 
+								   workers=3, seed=7, cmds_sink="gzip")
+	with gzip.open(serial_path, "rt") as file:
+		serial_cmds = file.read()
+	with gzip.open(parallel_path, "rt") as file:
+		parallel_cmds = file.read()
+	assert serial_cmds.startswith("# plant_seed: 7\n")
+	assert serial_cmds.count("plantnr(") == 6
+	assert parallel_cmds == serial_cmds
+	assert read_index(parallel_path + ".idx") == read_index(serial_path + ".idx")
+	# The rule cache counts of the workers are merged
+	assert parallel.rule_cache_hits > 0
+	assert parallel.rule_cache_hits + parallel.rule_cache_misses == \
+			serial.rule_cache_hits + serial.rule_cache_misses
+
+def plant_cmds(path, plantnr):
+	""" Return the cmds text lines of plantnr in the cmds file at path """
+	for nr, offset, lines in read_index(path + ".idx"):
+		if nr == plantnr:
+			with open(path) as file:
+				file.seek(offset)
+				return file.read().splitlines()[0:lines]
+	return None
+
+def test_regrow_plant_of_drawn_seed(tmp_path, monkeypatch):
+	run, path = grow(tmp_path, monkeypatch, name="L_NAPTR", workers=2)
+	seed = index_seed(path + ".idx")
+	assert seed is not None and run.p['seed'] == seed
+	# The seed is found in the index of the run
+	plant, plant_path = grow(tmp_path, monkeypatch, plantnr=4, name="L_NAPTR", 
+							 workers=2)
+	assert plant.seed == seed
+	assert plant_cmds(plant_path, 4) == plant_cmds(path, 4)
+	with pytest.raises(ValueError):
+		grow(tmp_path, monkeypatch, plantnr=4, seed=seed+1, name="L_NAPTR", 
+			 workers=2)
+	with pytest.raises(ValueError):
+		grow(tmp_path, monkeypatch, plantnr=7, name="L_NAPTR", workers=2)
+
+def test_regrow_plant_of_serial_run_refused(tmp_path, monkeypatch):
+	grow(tmp_path, monkeypatch, name="L_NAPTS", seed=7)
+	with pytest.raises(ValueError):
+		grow(tmp_path, monkeypatch, plantnr=4, seed=7, name="L_NAPTS")
+	with pytest.raises(ValueError):
+		grow(tmp_path / "new", monkeypatch, plantnr=4, seed=7)
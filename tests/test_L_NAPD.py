@@ -0,0 +1,89 @@
+#
+# Tests of the annotation of views by L_NAPD
+#
+import json
+import numpy as np
+import pytest
+
+from L_NAPD import mask_bbox, Manifest, save_manifest, load_manifest
+
+def mask_bbox_loop(img, threshold):
+    """
+    Return the same as mask_bbox(img, img > threshold), by the original
+    loop of L_NAPD over every pixel, but with its elif chains made ifs,
+    which missed the max y of a column and the box and value extremes
+    """
+    ylen, xlen = img.shape
+
+    # bbox itself
+    ybmin = ylen
+    ybmax = 0
+    xbmin = xlen
+    xbmax = 0
+
+    vmax = 0
+    vmin = 0
+
+    # for each x
+    for x in range(xlen):
+        ymin = ylen
+        ymax = 0
+        for y in range(ylen):
+            value = img[y][x]
+            if value > threshold:
+                if y < ymin:
+                    ymin = y
+                if y > ymax:
+                    ymax = y
+
+                if x < xbmin:
+                    xbmin = x
+                if x > xbmax:
+                    xbmax = x
+
+                if vmin == 0 or value < vmin:
+                    vmin = value
+                if value > vmax:
+                    vmax = value
+
+        if ymin < ybmin:
+            ybmin = ymin
+        if ymax > ybmax:
+            ybmax = ymax
+    return (xbmin, ybmin, xbmax, ybmax), vmin, vmax
+
+@pytest.mark.parametrize("kind", ["noise", "blob", "pixel", "sparse"])
+def test_mask_bbox_same_as_loop(kind):
+    rng = np.random.default_rng(["noise", "blob", "pixel", "sparse"].index(kind))
+    for k in range(50):
+        ylen, xlen = rng.integers(1, 60, 2)
+        img = rng.random((ylen, xlen)) * 0.3
+        if kind == "blob":
+            # A blob, as a view of a wheat head
+            y1, x1 = rng.integers(0, ylen), rng.integers(0, xlen)
+            y2, x2 = rng.integers(y1+1, ylen+1), rng.integers(x1+1, xlen+1)
+            img[y1:y2, x1:x2] += rng.random((y2-y1, x2-x1))
+        elif kind == "pixel":
+            img[rng.integers(0, ylen), rng.integers(0, xlen)] = 1.0
+        elif kind == "sparse":
+            img += rng.random((ylen, xlen)) * (rng.random((ylen, xlen)) < 0.05)
+        threshold = 0.5 if kind != "noise" else rng.random() * 0.3
+        assert mask_bbox(img, img > threshold) == mask_bbox_loop(img, threshold)
+
+def test_mask_bbox_empty():
+    img = np.zeros((4, 7))
+    assert mask_bbox(img, img > 0) == ((7, 4, 0, 0), 0, 0)
+
+def test_manifest_of_other_config_dropped(tmp_path):
+    path = str(tmp_path / "manifest.jsonl")
+    config = {'rle_format': "runs", 'qa_every': 1, 'threshold': "corners mean"}
+    entries = {"Wheat_0001_100_001.jpg": {'file_name': "Wheat_0001_100_001.jpg",
+                                          'image_id': 1, 'json': None}}
+    save_manifest(config, entries, path)
+    assert load_manifest(path) == (config, entries)
+    assert Manifest(path, dict(config)).entries == entries
+    assert Manifest(path, dict(config, rle_format="coco")).entries == {}
+    # A manifest of before the config was recorded
+    with open(path, "w") as file:
+        file.write(json.dumps(entries["Wheat_0001_100_001.jpg"]) + "\n")
+    assert Manifest(path, config).entries == {}
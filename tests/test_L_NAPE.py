@@ -0,0 +1,17 @@
+#
+# Tests of the evaluation of real images by L_NAPE
+#
+import os
+import numpy as np
+import cv2
+
+import L_NAPE
+from L_NAP_SCORE import MAXIMA
+
+def test_evaluate_without_templates():
+	real = np.full((60, 80), 50, dtype=np.uint8)
+	cv2.imwrite(os.path.join(L_NAPE.GWCD, "tr_empty.png"), real)
+	maxi, removed = L_NAPE.evaluate("tr_empty", [], [], eval_image=False)
+	assert maxi.dtype == MAXIMA and len(maxi) == 0
+	assert removed == set()
+	assert L_NAPE.detections_of(maxi, removed) == []
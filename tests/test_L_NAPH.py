@@ -0,0 +1,28 @@
+#
+# Tests of the headless turtle interpretation of L_NAPH
+#
+import numpy as np
+
+from L_NAPH import *
+
+def test_interpret_save_restore():
+	ops = np.array([OPCODE[name] for name in
+					['restore', 'draw', 'save', 'turn_left', 'draw', 'restore',
+					 'restore', 'draw', 'draw_obj']])
+	args = np.zeros((len(ops), 4))
+	args[:, 0] = [0, 1, 0, 90, 2, 0, 0, 4, 0]
+	args[:, 1] = 1
+	cylinders, objects = interpret(ops, args)
+	# The restores of an empty stack are ignored
+	assert np.allclose([c[0] for c in cylinders], [[0, 0, 0], [0, 0, 1], [0, 0, 1]])
+	assert not np.allclose(cylinders[1][1], cylinders[0][1])
+	assert np.allclose(cylinders[2][1], cylinders[0][1])
+	assert np.allclose(objects[0][1], [0, 0, 5])
+
+def test_draw_to_out_dir(tmp_path):
+	cmds = tmp_path / "plants.cmds"
+	cmds.write_text("\tplantnr(3)\n\tdraw(2.0, 0.5)\n\tpitch_up(30)\n"
+					"\tdraw_obj(\"Grain\", 1, 1, 1)\n\tfinish()\n")
+	assert Draw(str(cmds), out_dir=str(tmp_path / "models")) == 1
+	assert (tmp_path / "models" / "Wheat_003.obj").exists()
+	assert (tmp_path / "models" / "Wheat_003.mtl").exists()
@@ -0,0 +1,30 @@
+#
+# Tests of the consolidated dataset files of L_NAP_DATASET
+#
+from L_NAP_DATASET import *
+
+def view(image_id, k):
+	return {'image_id': image_id, 'file_name': f"v{k}.jpg", 'height': k}
+
+def test_ordered_writer_in_image_id_order(tmp_path):
+	filename = str(tmp_path / "dataset.json")
+	writer = DatasetWriter(filename)
+	for k in [1, 2, 3, 4, 6]:
+		writer.write(view(k, k))
+	writer.close()
+
+	# v1 and v2 are removed, and v4, v5 and v6 carried, v5 not from the
+	# previous dataset, but from elsewhere
+	views = [(image_id, f"v{k}.jpg") for image_id, k in enumerate([3, 4, 5, 6, 7], 1)]
+	writer = OrderedDatasetWriter(filename, 2, views, ["v3.jpg", "v7.jpg"],
+								  ["v4.jpg", "v5.jpg", "v6.jpg"],
+								  lambda file_name: view(0, 50))
+	writer.put("v7.jpg", view(5, 7))
+	assert len(writer.ready) == 1
+	writer.put("v3.jpg", view(1, 3))
+	assert len(writer.ready) == 0
+	assert writer.close() == [str(tmp_path / "dataset_0001.json"),
+							  str(tmp_path / "dataset_0002.json"),
+							  str(tmp_path / "dataset_0003.json")]
+	assert load_dataset(filename) == [view(1, 3), view(2, 4), view(3, 50),
+									  view(4, 6), view(5, 7)]
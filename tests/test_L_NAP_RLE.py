@@ -0,0 +1,34 @@
+#
+# Tests of the RLE codec of segmentation masks, L_NAP_RLE
+#
+import numpy as np
+import pytest
+
+from L_NAP_RLE import *
+
+@pytest.mark.parametrize("rle_format", RLE_FORMATS)
+def test_round_trip(rle_format):
+	rng = np.random.default_rng(0)
+	for n in range(100):
+		height, width = rng.integers(1, 50, 2)
+		mask = (rng.random((height, width)) < rng.random()).astype(np.uint8)
+		assert np.array_equal(decode(encode(mask, rle_format)), mask)
+
+def test_runs_overrun_rows():
+	mask = np.zeros((3, 4), dtype=np.uint8)
+	mask[0, 2:] = 1
+	mask[1, 0:1] = 1
+	mask[2, 3] = 1
+	assert runs_encode(mask) == [2, 3, 11, 1]
+	assert np.array_equal(runs_decode([2, 3, 11, 1], 3, 4), mask)
+
+def test_coco_counts():
+	mask = np.array([[1, 0, 0], [1, 1, 0]], dtype=np.uint8)
+	assert coco_encode(mask) == [0, 2, 1, 1, 2]
+	assert coco_decompress(coco_compress([0, 2, 1, 1, 2])) == [0, 2, 1, 1, 2]
+	counts = [5, 40, 1000, 3, 70000, 2]
+	assert coco_decompress(coco_compress(counts)) == counts
+
+def test_unknown_format():
+	with pytest.raises(ValueError):
+		encode(np.zeros((2, 2)), "png")
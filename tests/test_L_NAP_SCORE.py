@@ -0,0 +1,100 @@
+#
+# Tests of the window scores of L_NAP_SCORE, against the original loop
+# over every window of L_NAPE
+#
+import numpy as np
+import pytest
+
+from L_NAP_SCORE import *
+
+def score_map_loop(real, synt, step, min_score, maximus, shape):
+	"""
+	Return the (N, M) uint8 iscore matrix of synt on real, by a loop
+	over every window on the step grid, as the original L_NAPE
+	"""
+	rx_max, ry_max = real.shape
+	sx_max, sy_max = synt.shape
+	box_area = sx_max * sy_max
+	iscore = np.zeros(shape, dtype=np.uint8)
+	for n, x in enumerate(range(0, rx_max-step, step)):
+		for m, y in enumerate(range(0, ry_max-step, step)):
+			if x+sx_max <= rx_max and y+sy_max <= ry_max:
+				real_x = real[x:x+sx_max, y:y+sy_max]/2
+			else:
+				# at the right edge and bottom edge we move only valid
+				# pixels into a pre-filled zero array real_x
+				real_x = np.zeros((sx_max,sy_max), dtype=np.uint8)
+				sx_m = sx_max
+				if x+sx_m > rx_max:
+					sx_m = rx_max - x
+				sy_m = sy_max
+				if y+sy_m > ry_max:
+					sy_m = ry_max - y
+				real_x[0:sx_m, 0:sy_m] = real[x:x+sx_m, y:y+sy_m]/2
+
+			combine = real_x + synt
+			clipped = combine - 128
+			clipped = clipped.clip(0, None)
+			score = np.mean(clipped) * box_area
+
+			if score >= min_score:
+				iscore[n,m] = np.uint8(int(score/maximus*100) & 0xff)
+	return iscore
+
+def template(rng, sx_max, sy_max, halves=True):
+	""" Return a random synt of values from 32, in halves if halves """
+	synt = rng.integers(0, 256, (sx_max, sy_max)) / 2
+	if not halves:
+		synt += rng.random((sx_max, sy_max)) / 4
+	return (synt - 32).clip(0, None) + 32
+
+@pytest.mark.parametrize("size", [(20, 15), (60, 40), (95, 130), (200, 150)])
+@pytest.mark.parametrize("halves", [True, False])
+def test_score_map_same_as_loop(size, halves):
+	rng = np.random.default_rng(size[0])
+	real = rng.integers(0, 256, (120, 170), dtype=np.uint8)
+	step = 10
+	shape = (real.shape[0]//step, real.shape[1]//step)
+	synt = template(rng, *size, halves)
+	maximus = np.mean(synt - 32) * synt.size
+	for ratio in (0.2, 0.5):
+		expected = score_map_loop(real, synt, step, ratio * maximus, maximus, shape)
+		assert np.array_equal(score_map(real, synt, step, ratio * maximus,
+										maximus, shape), expected)
+		# A few grid rows at a time
+		assert np.array_equal(score_map(real, synt, step, ratio * maximus,
+										maximus, shape, chunk=1000), expected)
+
+def blobs_image(rng, size, count):
+	""" Return a uint8 real image of noise and count bright ellipses """
+	real = rng.normal(60, 15, (size, size))
+	yy, xx = np.mgrid[0:size, 0:size]
+	for k in range(count):
+		y, x = rng.integers(20, size - 20, 2)
+		a, b = rng.integers(25, 45, 2)
+		real[((yy - y)/a)**2 + ((xx - x)/b)**2 < 1] = rng.integers(170, 230)
+	return real.clip(0, 255).astype(np.uint8)
+
+def peaks_of(maxima):
+	return {(int(p['x1']), int(p['y1']), int(p['score'])) for p in maxima}
+
+@pytest.mark.parametrize("factor", [2, 4, 8])
+def test_pyramid_map_peaks_of_score_map(factor):
+	rng = np.random.default_rng(factor)
+	real = blobs_image(rng, 400, 8)
+	synt = np.full((70, 90), 32.0)
+	yy, xx = np.mgrid[0:70, 0:90]
+	synt[((yy - 35)/33)**2 + ((xx - 45)/43)**2 < 1] = 100
+	maximus = np.mean(synt - 32) * synt.size
+	step = 10
+	shape = (real.shape[0]//step, real.shape[1]//step)
+	for ratio in (0.3, 0.5):
+		iscore = score_map(real, synt, step, ratio * maximus, maximus, shape)
+		found = peaks_of(local_maxima(iscore, step, synt.shape))
+		iscore, refined = pyramid_map(real, synt, step, ratio * maximus, 
+									  maximus, shape, factor)
+		# The local maxima of the refined cells, no others, are as found
+		peaks = peaks_of(local_maxima(iscore, step, synt.shape, mask=refined))
+		assert peaks <= found
+		assert len(peaks) >= 0.9 * len(found) > 0
+		assert peaks == {p for p in found if refined[p[1]//step, p[0]//step]}